@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+from rich.console import Console
+
+# Renders the streamed agent events of one question onto a console, e.g. main.print_results
+Renderer = Callable[[List[Dict[str, Any]], Console], None]
+
+
+def positive_int(value: str) -> int:
+    """argparse type of --concurrency, a semaphore of 0 would never let a question through."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """argparse type of --timeout."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+
+@dataclass
+class BatchResult:
+    index: int
+    question: str
+    status: str  # "ok", "timeout" or "error: ..."
+    elapsed_seconds: float
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    output: str = ""
+
+    @property
+    def answer(self) -> str:
+        """Content of the last message of the run, i.e. the agent's final answer."""
+        if not self.events:
+            return ""
+        return self.events[-1]["messages"][-1].content
+
+
+async def _collect_events(
+    agent, question: str, events: List[Dict[str, Any]], router=None, tracer=None
+) -> None:
+    if router is not None:
+        from .tracing import optional_span
+
+        # Canonical funnel questions are answered without the LLM, see router.FastPathRouter
+        with optional_span(tracer, "fast_path", "router"):
+            fast_path_events = await asyncio.to_thread(router.answer, question)
+        if fast_path_events is not None:
+            events.extend(fast_path_events)
+            return
+
+    async for event in agent.astream(
+        {"messages": [("user", question)]},
+        config={"callbacks": [tracer]} if tracer is not None else None,
+        stream_mode="values",
+    ):
+        events.append(event)
+
+
+async def _answer_question(
+    agent,
+    index: int,
+    question: str,
+    semaphore: asyncio.Semaphore,
+    timeout: float,
+    render: Renderer,
+    console: Console,
+    router=None,
+    trace_sink=None,
+) -> BatchResult:
+    events: List[Dict[str, Any]] = []
+    tracer = None
+
+    async with semaphore:
+        if trace_sink is not None:
+            from .tracing import RunTracer
+
+            # Created once a slot is free, so time spent queueing isn't counted.
+            tracer = RunTracer(question)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                _collect_events(agent, question, events, router, tracer), timeout
+            )
+            status = "ok"
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except Exception as e:
+            status = f"error: {e}"
+        elapsed = time.perf_counter() - start
+    if tracer is not None:
+        trace_sink.record(tracer.summary(status))
+
+    # Render into a private buffer, so concurrent questions never interleave their output.
+    buffer = Console(
+        file=io.StringIO(),
+        width=console.width,
+        force_terminal=console.is_terminal,
+        color_system=console.color_system,
+    )
+    buffer.print(f"Question #{index}: {question}", style="bold")
+    render(events, buffer)
+    if status != "ok":
+        buffer.print(f"Question #{index} did not complete ({status})", style="bold red")
+    buffer.print(f"Question #{index} took {elapsed:.2f}s", style="dim")
+
+    return BatchResult(index, question, status, elapsed, events, buffer.file.getvalue())
+
+
+async def run_batch(
+    agent,
+    questions: List[str],
+    render: Renderer,
+    console: Console,
+    concurrency: int = 4,
+    timeout: float = 120.0,
+    router=None,
+    trace_sink=None,
+) -> List[BatchResult]:
+    """
+    Answers many questions concurrently through the agent's async streaming interface.
+
+    Each question's output is written to `console` in one piece as soon as it completes.
+    When a `router` is given, questions it recognizes skip the agent entirely.
+    When a `trace_sink` is given, a tracing.RunTracer summary is recorded per question.
+    Results are returned in the same order as `questions`.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    if not timeout > 0:
+        raise ValueError(f"timeout must be greater than 0, got {timeout}")
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.create_task(
+            _answer_question(
+                agent,
+                i,
+                question,
+                semaphore,
+                timeout,
+                render,
+                console,
+                router,
+                trace_sink,
+            )
+        )
+        for i, question in enumerate(questions, 1)
+    ]
+
+    for completed in asyncio.as_completed(tasks):
+        result = await completed
+        console.file.write(result.output)
+        console.file.flush()
+
+    return [task.result() for task in tasks]
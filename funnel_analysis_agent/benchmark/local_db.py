@@ -0,0 +1,234 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+
+from ..router import FUNNEL_STEPS
+from ..schema_cache import CachedSQLDatabase
+
+CATEGORIES = ["Electronics", "Clothing", "Home & Kitchen", "Toys", "Books", "Sports"]
+EMBEDDING_DIMENSIONS = 384
+
+_FIRST_NAMES = ["Michael", "Lauren", "Nathan", "Brett", "Ava", "Noah", "Mia", "Liam"]
+_LAST_NAMES = ["Diaz", "Johnson", "Morris", "Castillo", "Smith", "Lee", "Garcia", "Kim"]
+_PRODUCT_WORDS = ["Media", "College", "News", "Fact", "Rather", "Analysis", "Watch"]
+_PRODUCT_KINDS = {
+    "Electronics": ["Headphones", "Speaker", "Tablet", "Camera"],
+    "Clothing": ["Jeans", "Jacket", "Sneakers", "Hoodie"],
+    "Home & Kitchen": ["Mixer", "Kettle", "Blender", "Toaster"],
+    "Toys": ["Lego Set", "Puzzle", "Action Figure", "Board Game"],
+    "Books": ["Novel", "Cookbook", "Atlas", "Biography"],
+    "Sports": ["Yoga Mat", "Dumbbell", "Football", "Racket"],
+}
+
+
+_QUERY_OPTIONS_RE = re.compile(r"\s+OPTION\s*\([^)]*\)\s*;?\s*$", re.IGNORECASE)
+
+
+# Stand-ins for the Pinot functions used by the agent, registered on every sqlite connection.
+
+
+def _steps(*predicates) -> str:
+    """STEPS(p1, p2, ...) -> which funnel steps this row matches, e.g. "1000"."""
+    return "".join("1" if p else "0" for p in predicates)
+
+
+def _correlate_by(value):
+    return value
+
+
+class _FunnelCount:
+    """FUNNEL_COUNT(STEPS(...), CORRELATE_BY(col)): users that reached each step, in order."""
+
+    def __init__(self):
+        self.users_per_step: List[set] = []
+
+    def step(self, steps: str, user):
+        if not self.users_per_step:
+            self.users_per_step = [set() for _ in steps]
+        for i, matched in enumerate(steps):
+            if matched == "1":
+                self.users_per_step[i].add(user)
+
+    def finalize(self) -> str:
+        counts, reached = [], None
+        for users in self.users_per_step:
+            reached = users if reached is None else reached & users
+            counts.append(len(reached))
+        # Pinot returns an array, sqlite can only hand back scalars.
+        return json.dumps(counts)
+
+
+@dataclass
+class LocalPinot:
+    """
+    A local SQL engine (sqlite) seeded with synthetic clickstream_events, purchase_info,
+    NewProducts and Users data, that understands the Pinot functions the agent uses
+    (FUNNEL_COUNT, STEPS, CORRELATE_BY, LOOKUP). Query options, e.g. OPTION(numGroupsLimit=...),
+    are ignored.
+    """
+
+    path: str
+    db: CachedSQLDatabase
+    users: Dict[str, str]  # ID -> Name
+    products: Dict[str, Dict[str, Any]]  # ID -> {"Name", "Description", "Category"}
+    row_counts: Dict[str, int] = field(default_factory=dict)
+
+    def top_user_ids(self, n: int) -> List[str]:
+        rows = self.db.run(
+            "SELECT user_id FROM clickstream_events GROUP BY user_id "
+            f"ORDER BY SUM(duration) DESC LIMIT {n}",
+            fetch="cursor",
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        self.db._engine.dispose()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _strip_query_options(conn, cursor, statement, parameters, context, executemany):
+    # sqlite has no query options, and no group limit to raise.
+    return _QUERY_OPTIONS_RE.sub("", statement), parameters
+
+
+def _register_functions(dbapi_connection: sqlite3.Connection, dimensions) -> None:
+    def lookup(table, column, *keys_and_values):
+        # LOOKUP('db.dimTable', 'dimColumn', 'dimKey', factValue), only single keys here
+        rows = dimensions.get(table.split(".")[-1], {})
+        row = rows.get(keys_and_values[1]) if len(keys_and_values) >= 2 else None
+        return None if row is None else row.get(column)
+
+    dbapi_connection.create_function("STEPS", -1, _steps, deterministic=True)
+    dbapi_connection.create_function("CORRELATE_BY", 1, _correlate_by)
+    dbapi_connection.create_aggregate("FUNNEL_COUNT", 2, _FunnelCount)
+    dbapi_connection.create_function("LOOKUP", -1, lookup)
+
+
+def _embedding(rng: random.Random, category_index: int) -> List[float]:
+    # Products of the same category share a direction, so similarity search is meaningful.
+    vector = [rng.gauss(0, 0.3) for _ in range(EMBEDDING_DIMENSIONS)]
+    vector[category_index] += 3.0
+    return [round(v, 6) for v in vector]
+
+
+def create_local_pinot(
+    scale: int = 10_000, seed: int = 42, path: Optional[str] = None
+) -> LocalPinot:
+    """
+    Seeds a local database with roughly `scale` clickstream events, and proportionally
+    sized users, products and purchases. Same scale and seed give the same data.
+    """
+    rng = random.Random(seed)
+    n_users = max(10, scale // 50)
+    n_products = max(24, scale // 100)
+
+    users = {
+        f"user-{i:06d}": f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+        for i in range(n_users)
+    }
+    products = {}
+    product_rows = []
+    for i in range(n_products):
+        category_index = i % len(CATEGORIES)
+        category = CATEGORIES[category_index]
+        name = f"{rng.choice(_PRODUCT_WORDS)} {rng.choice(_PRODUCT_KINDS[category])}"
+        description = f"A high-quality {name.split(' ', 1)[1].lower()} perfect for {category.lower()} enthusiasts."
+        product_id = f"product-{i:06d}"
+        products[product_id] = {
+            "Name": name,
+            "Description": description,
+            "Category": category,
+        }
+        product_rows.append(
+            (
+                product_id,
+                name,
+                description,
+                category,
+                json.dumps(_embedding(rng, category_index)),
+            )
+        )
+
+    events, purchases = [], []
+    user_ids, product_ids = list(users), list(products)
+    timestamp = 1_733_000_000_000
+    # How far down the funnel each user ever gets, so FUNNEL_COUNT shows real drop-offs.
+    depth = {
+        user_id: rng.choices(range(1, len(FUNNEL_STEPS) + 1), weights=(4, 3, 1, 2))[0]
+        for user_id in user_ids
+    }
+    # Every session walks down the funnel, and drops off with some probability at each step.
+    while len(events) < scale:
+        user_id, product_id = rng.choice(user_ids), rng.choice(product_ids)
+        for step, keep in zip(FUNNEL_STEPS[: depth[user_id]], (1.0, 0.6, 0.5, 0.4)):
+            if rng.random() > keep:
+                break
+            timestamp += rng.randint(1, 5_000)
+            events.append(
+                (user_id, product_id, step, timestamp, float(rng.randint(100, 60_000)))
+            )
+            if step == "purchase":
+                purchases.append((product_id, user_id, rng.randint(1, 5), timestamp))
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="local_pinot_", suffix=".db")
+        os.close(fd)
+    with sqlite3.connect(path) as connection:
+        connection.executescript("""
+            DROP TABLE IF EXISTS clickstream_events;
+            DROP TABLE IF EXISTS purchase_info;
+            DROP TABLE IF EXISTS NewProducts;
+            DROP TABLE IF EXISTS Users;
+            CREATE TABLE clickstream_events (user_id TEXT, product_id TEXT, event_type TEXT, event_timestamp BIGINT, duration DOUBLE);
+            CREATE TABLE purchase_info (product_id TEXT, user_id TEXT, quantity INTEGER, purchase_timestamp BIGINT);
+            CREATE TABLE NewProducts (ID TEXT, Name TEXT, Description TEXT, Category TEXT, embedding TEXT);
+            CREATE TABLE Users (ID TEXT, Name TEXT);
+            """)
+        connection.executemany(
+            "INSERT INTO clickstream_events VALUES (?, ?, ?, ?, ?)", events
+        )
+        connection.executemany(
+            "INSERT INTO purchase_info VALUES (?, ?, ?, ?)", purchases
+        )
+        connection.executemany(
+            "INSERT INTO NewProducts VALUES (?, ?, ?, ?, ?)", product_rows
+        )
+        connection.executemany("INSERT INTO Users VALUES (?, ?)", list(users.items()))
+
+    dimensions = {
+        "Users": {
+            user_id: {"ID": user_id, "Name": name} for user_id, name in users.items()
+        },
+        "NewProducts": {
+            product_id: {"ID": product_id, **product}
+            for product_id, product in products.items()
+        },
+    }
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(
+        engine,
+        "connect",
+        lambda dbapi_connection, _: _register_functions(dbapi_connection, dimensions),
+    )
+    event.listen(engine, "before_cursor_execute", _strip_query_options, retval=True)
+
+    return LocalPinot(
+        path=path,
+        db=CachedSQLDatabase(engine),
+        users=users,
+        products=products,
+        row_counts={
+            "clickstream_events": len(events),
+            "purchase_info": len(purchases),
+            "NewProducts": len(product_rows),
+            "Users": len(users),
+        },
+    )
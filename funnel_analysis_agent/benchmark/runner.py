@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import functools
+import io
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from langgraph.checkpoint.memory import MemorySaver
+from rich.console import Console
+from rich.table import Table
+
+from ..batch import BatchResult, positive_float, positive_int, run_batch
+from ..dimensions import DimensionStore
+from ..funnel_view import IncrementalFunnel
+from ..query_results import ResultStore
+from ..main import build_agent, build_system_message, build_tools, print_results
+from ..recommendations import LocalEmbeddingIndex, ProductRecommender
+from ..result_cache import QueryResultCache, pinot_watermark_fn
+from ..router import FastPathRouter
+from ..sessions import DEFAULT_HISTORY_TOKEN_BUDGET, Session
+from ..tracing import RunTracer, TraceSink, _quantile
+from .local_db import create_local_pinot
+from .scripted_llm import ScriptedChatModel
+from .workloads import WORKLOADS, demo_workload, synthetic_workload
+
+# Metrics compared against a baseline report, and whether higher is better.
+REGRESSION_METRICS = {
+    "throughput_qps": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+}
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _stage_latencies(summaries: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    durations: Dict[str, List[float]] = {}
+    for summary in summaries:
+        for span in summary["spans"]:
+            stage = span["name"] if span["kind"] == "tool" else span["kind"]
+            durations.setdefault(stage, []).append(span["duration_ms"])
+    return {
+        stage: {
+            "count": len(values),
+            "p50_ms": _quantile(values, 0.5),
+            "p99_ms": _quantile(values, 0.99),
+            "total_ms": sum(values),
+        }
+        for stage, values in sorted(durations.items())
+    }
+
+
+def _run_session(
+    session: Session, questions: List[str], trace_sink: TraceSink
+) -> List[BatchResult]:
+    # One conversation, so questions are answered one after another.
+    results = []
+    for i, question in enumerate(questions, 1):
+        tracer = RunTracer(question)
+        start = time.perf_counter()
+        try:
+            events = list(session.stream(question, tracer))
+            status = "ok"
+        except Exception as e:
+            events, status = [], f"error: {e}"
+        trace_sink.record(tracer.summary(status))
+        results.append(
+            BatchResult(i, question, status, time.perf_counter() - start, events)
+        )
+    return results
+
+
+def run_benchmark(
+    workload: str = "demo",
+    scale: int = 10_000,
+    questions: int = 100,
+    concurrency: int = 4,
+    fast_path: bool = True,
+    llm_latency_ms: float = 0.0,
+    timeout: float = 120.0,
+    seed: int = 42,
+    trace_memory: bool = False,
+    session: bool = False,
+    funnel_view: bool = True,
+    token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+) -> Dict[str, Any]:
+    """
+    Answers a workload through the real agent graph, with a scripted LLM and a local
+    Pinot stand-in, and returns throughput, per-stage latency and memory figures.
+    With `session`, all questions are asked in one conversation, whose history is
+    compacted to `token_budget`.
+    """
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    local = create_local_pinot(scale=scale, seed=seed)
+    seed_seconds = time.perf_counter() - start
+    try:
+        if workload == "demo":
+            questions_and_scripts = demo_workload(local, funnel_view=funnel_view)
+        else:
+            questions_and_scripts = synthetic_workload(
+                local, questions, seed=seed, funnel_view=funnel_view
+            )
+
+        db = local.db
+        llm = ScriptedChatModel(
+            scripts=dict(questions_and_scripts), latency_ms=llm_latency_ms
+        )
+        result_cache = QueryResultCache(watermark_fn=pinot_watermark_fn(db))
+        dimensions = DimensionStore(db)
+        # Pinot's VECTOR_SIMILARITY has no sqlite equivalent, so the local index is used.
+        recommender = ProductRecommender(db, local_index=LocalEmbeddingIndex(db))
+        results_store = ResultStore()
+        funnel = IncrementalFunnel(db) if funnel_view else None
+        router = (
+            FastPathRouter(db, dimensions=dimensions, funnel=funnel)
+            if fast_path
+            else None
+        )
+
+        start = time.perf_counter()
+        agent = build_agent(
+            llm,
+            build_tools(
+                db,
+                llm,
+                result_cache,
+                dimensions,
+                recommender,
+                results=results_store,
+                funnel=funnel,
+            ),
+            build_system_message(db, prompt_source="bundled"),
+            checkpointer=MemorySaver() if session else None,
+            token_budget=token_budget,
+        )
+        build_seconds = time.perf_counter() - start
+
+        questions = [question for question, _ in questions_and_scripts]
+        trace_sink = TraceSink()
+        start = time.perf_counter()
+        if session:
+            results = _run_session(
+                Session(agent, router=router, token_budget=token_budget),
+                questions,
+                trace_sink,
+            )
+        else:
+            results = asyncio.run(
+                run_batch(
+                    agent,
+                    questions,
+                    render=functools.partial(print_results, results=results_store),
+                    console=Console(file=io.StringIO(), width=120),
+                    concurrency=concurrency,
+                    timeout=timeout,
+                    router=router,
+                    trace_sink=trace_sink,
+                )
+            )
+        wall_seconds = time.perf_counter() - start
+    finally:
+        local.close()
+
+    memory = {"max_rss_mb": _max_rss_mb()}
+    if trace_memory:
+        memory["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    statuses: Dict[str, int] = {}
+    for result in results:
+        status = result.status.split(":")[0]
+        statuses[status] = statuses.get(status, 0) + 1
+    summaries = trace_sink.summaries
+    latencies = [result.elapsed_seconds * 1000 for result in results]
+
+    return {
+        "config": {
+            "workload": workload,
+            "scale": scale,
+            "questions": len(results),
+            "concurrency": 1 if session else concurrency,
+            "fast_path": fast_path,
+            "session": session,
+            "funnel_view": funnel_view,
+            "llm_latency_ms": llm_latency_ms,
+            "seed": seed,
+        },
+        "row_counts": local.row_counts,
+        "seed_seconds": seed_seconds,
+        "build_seconds": build_seconds,
+        "wall_seconds": wall_seconds,
+        "throughput_qps": len(results) / wall_seconds if wall_seconds else 0.0,
+        "statuses": statuses,
+        "latency_p50_ms": _quantile(latencies, 0.5),
+        "latency_p99_ms": _quantile(latencies, 0.99),
+        "llm_calls": sum(summary["llm_calls"] for summary in summaries),
+        "tool_calls": sum(summary["tool_calls"] for summary in summaries),
+        "input_tokens": sum(summary["input_tokens"] for summary in summaries),
+        "max_input_tokens_per_call": max(
+            (
+                span["input_tokens"]
+                for summary in summaries
+                for span in summary["spans"]
+            ),
+            default=0,
+        ),
+        "output_tokens": sum(summary["output_tokens"] for summary in summaries),
+        "stages": _stage_latencies(summaries),
+        "result_cache": result_cache.stats(),
+        "funnel_view": funnel.stats() if funnel is not None else None,
+        "memory": memory,
+    }
+
+
+def compare_to_baseline(
+    report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> List[str]:
+    """Metrics that got worse than the baseline by more than `max_regression` (a fraction)."""
+    regressions = []
+    for metric, higher_is_better in REGRESSION_METRICS.items():
+        old, new = baseline.get(metric), report.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > max_regression:
+            regressions.append(f"{metric}: {old:.3f} -> {new:.3f} ({change:+.1%})")
+    return regressions
+
+
+def print_report(report: Dict[str, Any], console: Console) -> None:
+    config = report["config"]
+    console.print(
+        f"[bold]{config['workload']}[/bold] workload: {config['questions']} questions, "
+        f"scale {config['scale']} ({report['row_counts']}), "
+        f"concurrency {config['concurrency']}, "
+        f"fast path {'on' if config['fast_path'] else 'off'}, "
+        f"{'one session' if config['session'] else 'independent questions'}, "
+        f"LLM latency {config['llm_latency_ms']}ms"
+    )
+    console.print(
+        f"Throughput: {report['throughput_qps']:.2f} questions/s "
+        f"({report['wall_seconds']:.2f}s wall, seeding {report['seed_seconds']:.2f}s, "
+        f"agent build {report['build_seconds']:.2f}s)"
+    )
+    console.print(
+        f"Latency: p50 {report['latency_p50_ms']:.1f}ms, "
+        f"p99 {report['latency_p99_ms']:.1f}ms; statuses {report['statuses']}"
+    )
+    console.print(
+        f"LLM calls {report['llm_calls']}, tool calls {report['tool_calls']}, "
+        f"tokens {report['input_tokens']} in / {report['output_tokens']} out, "
+        f"largest prompt {report['max_input_tokens_per_call']} tokens"
+    )
+
+    table = Table(title="Per-stage latency")
+    for column in ("stage", "count", "p50 (ms)", "p99 (ms)", "total (ms)"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for stage, stats in report["stages"].items():
+        table.add_row(
+            stage,
+            str(stats["count"]),
+            f"{stats['p50_ms']:.2f}",
+            f"{stats['p99_ms']:.2f}",
+            f"{stats['total_ms']:.1f}",
+        )
+    console.print(table)
+
+    console.print(f"Result cache: {report['result_cache']}")
+    if report["funnel_view"] is not None:
+        console.print(f"Funnel view: {report['funnel_view']}")
+    console.print(
+        "Memory: "
+        + ", ".join(f"{name} {mb:.1f}MB" for name, mb in report["memory"].items())
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of the Funnel Analysis Agent, with a scripted LLM "
+        "and a local stand-in for Pinot. No network access needed."
+    )
+    parser.add_argument(
+        "--workload",
+        choices=WORKLOADS,
+        default="demo",
+        help="'demo' are the main.input_prompts questions, 'synthetic' are generated ones.",
+    )
+    parser.add_argument(
+        "--scale",
+        type=int,
+        default=10_000,
+        help="Number of clickstream events to seed, the other tables scale with it.",
+    )
+    parser.add_argument(
+        "--questions",
+        type=int,
+        default=100,
+        help="Number of questions of the synthetic workload.",
+    )
+    parser.add_argument("--concurrency", type=positive_int, default=4)
+    parser.add_argument("--timeout", type=positive_float, default=120.0)
+    parser.add_argument(
+        "--llm-latency-ms",
+        type=float,
+        default=0.0,
+        help="Simulated latency of every LLM call.",
+    )
+    parser.add_argument(
+        "--no-fast-path",
+        action="store_true",
+        help="Send every question to the agent, even the canonical funnel questions.",
+    )
+    parser.add_argument(
+        "--session",
+        action="store_true",
+        help="Ask all questions one after another in one conversation.",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DEFAULT_HISTORY_TOKEN_BUDGET,
+        help="Token budget of the conversation history, older tool outputs get compacted.",
+    )
+    parser.add_argument(
+        "--no-funnel-view",
+        action="store_true",
+        help="Answer funnel questions with FUNNEL_COUNT queries, instead of the incremental view.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also report the peak of Python allocations (slows the run down).",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument(
+        "--baseline",
+        help="JSON report of a previous run, exit with status 1 if this run regressed.",
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="Tolerated regression against the baseline, as a fraction.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = run_benchmark(
+        workload=args.workload,
+        scale=args.scale,
+        questions=args.questions,
+        concurrency=args.concurrency,
+        fast_path=not args.no_fast_path,
+        llm_latency_ms=args.llm_latency_ms,
+        timeout=args.timeout,
+        seed=args.seed,
+        trace_memory=args.trace_memory,
+        session=args.session,
+        funnel_view=not args.no_funnel_view,
+        token_budget=args.token_budget,
+    )
+
+    console = Console()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, console)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.max_regression)
+        if regressions:
+            # stderr, so that --json output stays parseable
+            Console(stderr=True).print(
+                "Regressions against the baseline:\n" + "\n".join(regressions),
+                style="bold red",
+            )
+            return 1
+    return 0
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# One turn of a recorded run: either a tool call {"tool": name, "args": {...}},
+# or the final answer {"answer": text}.
+Step = Dict[str, Any]
+
+DEFAULT_ANSWER = "I don't know how to answer that question."
+
+
+def _count_tokens(text: str) -> int:
+    # Rough OpenAI tokenizer estimate, good enough to track prompt growth between runs.
+    return max(1, len(text) // 4)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic chat model that replays recorded tool-call scripts, keyed by question.
+
+    The step to replay is the number of AI turns since the last human message, so the
+    same model serves any number of concurrent runs. Questions without a script are
+    answered with `default_answer` right away.
+    """
+
+    scripts: Dict[str, List[Step]]
+    latency_ms: float = 0.0  # simulated time to first token of a real model
+    default_answer: str = DEFAULT_ANSWER
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs) -> "ScriptedChatModel":
+        # Tool calls come from the script, there's nothing to bind.
+        return self
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        question, step_index = None, 0
+        for message in reversed(messages):
+            if message.type == "human":
+                question = message.content
+                break
+            if message.type == "ai":
+                step_index += 1
+
+        script = self.scripts.get(question, [])
+        step = (
+            script[step_index]
+            if step_index < len(script)
+            else {"answer": self.default_answer}
+        )
+        if "answer" in step:
+            message = AIMessage(content=step["answer"])
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": step["tool"],
+                        "args": step["args"],
+                        "id": f"call_{step_index}",
+                    }
+                ],
+            )
+
+        input_tokens = sum(_count_tokens(str(m.content)) for m in messages)
+        output_tokens = _count_tokens(
+            message.content + json.dumps(step.get("args", {}))
+        )
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs,
+    ) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return ChatResult(
+            generations=[ChatGeneration(message=self._next_message(messages))]
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs,
+    ) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(
+            generations=[ChatGeneration(message=self._next_message(messages))]
+        )
@@ -0,0 +1,169 @@
+import random
+from typing import List, Tuple
+
+from ..main import input_prompts
+from ..router import (
+    FUNNEL_STEPS,
+    category_products_sql,
+    funnel_count_sql,
+    top_items_sold_sql,
+    top_users_by_time_sql,
+)
+from .local_db import CATEGORIES, LocalPinot
+from .scripted_llm import Step
+
+# A question and the recorded tool-call script the scripted model replays for it.
+Workload = List[Tuple[str, List[Step]]]
+
+WORKLOADS = ("demo", "synthetic")
+
+
+def _query_steps(query: str, check: bool = True) -> List[Step]:
+    # The agent is told to double check every query before running it.
+    steps = (
+        [{"tool": "sql_db_query_checker", "args": {"query": query}}] if check else []
+    )
+    return steps + [{"tool": "sql_db_query", "args": {"query": query}}]
+
+
+def _category_product_ids(local: LocalPinot, category: str) -> List[str]:
+    return sorted(
+        product_id
+        for product_id, product in local.products.items()
+        if category.lower() in product["Category"].lower()
+    )
+
+
+def _funnel_steps(funnel_view: bool) -> List[Step]:
+    # With the funnel view, the agent is told to use the funnel_counts tool instead.
+    if funnel_view:
+        return [{"tool": "funnel_counts", "args": {}}]
+    return _query_steps(funnel_count_sql())
+
+
+def _conversion_rate_script(funnel_view: bool) -> List[Step]:
+    return _funnel_steps(funnel_view) + [
+        {
+            "answer": "The overall funnel conversion rate is the purchase count over the view count."
+        }
+    ]
+
+
+def _drop_off_script(funnel_view: bool) -> List[Step]:
+    return _funnel_steps(funnel_view) + [
+        {
+            "answer": "The biggest drop-off is between the steps with the largest relative decrease."
+        }
+    ]
+
+
+def _top_users_script(n: int) -> List[Step]:
+    return _query_steps(top_users_by_time_sql(n)) + [
+        {"answer": f"These are the top {n} users in terms of time spent."}
+    ]
+
+
+def _raw_events_script(event_type: str) -> List[Step]:
+    # A careless query, that reads a large part of the fact table.
+    query = (
+        f"SELECT * FROM clickstream_events WHERE event_type = '{event_type}' "
+        f"LIMIT 100000"
+    )
+    return _query_steps(query) + [{"answer": f"These are the {event_type} events."}]
+
+
+def _recommendation_script(user_ids: List[str]) -> List[Step]:
+    return [
+        {"tool": "recommend_products", "args": {"user_ids": user_ids, "k": 3}},
+        {"answer": "Here are the recommended products for these users."},
+    ]
+
+
+def _top_items_script(local: LocalPinot, n: int, category: str = None) -> List[Step]:
+    if category is None:
+        return _query_steps(top_items_sold_sql(n)) + [
+            {"answer": f"These are the top {n} items sold."}
+        ]
+    # LOOKUP can't filter, so the category's products are fetched first (finetuned_prompt Q5).
+    return (
+        _query_steps(category_products_sql(category), check=False)
+        + _query_steps(
+            top_items_sold_sql(n, _category_product_ids(local, category) or ["none"])
+        )
+        + [{"answer": f"These are the top {n} {category} items sold."}]
+    )
+
+
+def demo_workload(local: LocalPinot, funnel_view: bool = True) -> Workload:
+    """The main.input_prompts questions, scripted the way gpt-4o-mini answers them."""
+    top_users = local.top_user_ids(3)
+    scripts = [
+        _conversion_rate_script(funnel_view),
+        _drop_off_script(funnel_view),
+        _top_users_script(3),
+        _recommendation_script(top_users),
+        _top_items_script(local, 5, "electronic"),
+    ]
+    return list(zip(input_prompts, scripts))
+
+
+def synthetic_workload(
+    local: LocalPinot, size: int, seed: int = 42, funnel_view: bool = True
+) -> Workload:
+    """`size` questions drawn from templates of the canonical questions, with varying parameters."""
+    rng = random.Random(seed)
+    user_ids = sorted(local.users)
+    workload = []
+    for _ in range(size):
+        kind = rng.randrange(7)
+        n = rng.randint(1, 10)
+        if kind == 0:
+            workload.append(
+                (
+                    "What is the overall funnel conversion rate?",
+                    _conversion_rate_script(funnel_view),
+                )
+            )
+        elif kind == 1:
+            workload.append(
+                (
+                    "What is the biggest drop-off in the funnel?",
+                    _drop_off_script(funnel_view),
+                )
+            )
+        elif kind == 2:
+            workload.append(
+                (
+                    f"Who are the top {n} users in terms of time spent?",
+                    _top_users_script(n),
+                )
+            )
+        elif kind == 3:
+            workload.append(
+                (f"What are the top {n} items sold?", _top_items_script(local, n))
+            )
+        elif kind == 4:
+            category = rng.choice(CATEGORIES)
+            workload.append(
+                (
+                    f"What are the top {n} {category.lower()} items sold?",
+                    _top_items_script(local, n, category.lower()),
+                )
+            )
+        elif kind == 5:
+            event_type = rng.choice(FUNNEL_STEPS)
+            workload.append(
+                (
+                    f"Show me all the {event_type} events.",
+                    _raw_events_script(event_type),
+                )
+            )
+        else:
+            users = rng.sample(user_ids, k=min(len(user_ids), rng.randint(1, 5)))
+            workload.append(
+                (
+                    f"What other products can we recommend to users {', '.join(users)}?",
+                    _recommendation_script(users),
+                )
+            )
+    return workload
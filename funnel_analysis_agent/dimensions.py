@@ -0,0 +1,116 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy.exc import SQLAlchemyError
+
+from .query_results import ColumnarResult
+
+# The dimension tables hardly change, refreshing them every 10 minutes is plenty.
+DEFAULT_REFRESH_INTERVAL_SECONDS = 600.0
+
+
+@dataclass(frozen=True)
+class DimensionTable:
+    name: str
+    key: str  # primary key column of the dimension table
+    columns: Tuple[str, ...]  # columns used to decorate query results
+    fact_key: str  # column of the fact tables holding the dimension key
+    prefix: str  # prefix of the decorated columns, e.g. "user_" -> "user_name"
+
+
+DIMENSION_TABLES = (
+    DimensionTable("Users", "ID", ("Name",), "user_id", "user_"),
+    DimensionTable(
+        "NewProducts", "ID", ("Name", "Description"), "product_id", "product_"
+    ),
+)
+
+
+class DimensionStore:
+    """
+    In-process copy of the small Users and NewProducts dimension tables.
+
+    Pinot's LOOKUP can't be combined with GROUP BY (see finetuned_prompt item 7), so
+    instead of follow-up queries, aggregate results are decorated with dimension
+    columns locally. Each table is reloaded lazily once it is older than
+    `refresh_interval` seconds.
+
+    Keys are compared as strings, fact tables may hold an ID as INT that the dimension
+    table holds as STRING (or the other way around).
+    """
+
+    def __init__(
+        self,
+        db: SQLDatabase,
+        tables: Sequence[DimensionTable] = DIMENSION_TABLES,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL_SECONDS,
+    ):
+        self.db = db
+        self.tables = {table.name: table for table in tables}
+        self.refresh_interval = refresh_interval
+        # table name -> (str(key) -> tuple of values in the order of DimensionTable.columns)
+        self._rows: Dict[str, Dict[str, Tuple]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, table_name: Optional[str] = None) -> None:
+        """Reloads one dimension table, or all of them."""
+        for table in (
+            [self.tables[table_name]] if table_name else list(self.tables.values())
+        ):
+            columns = ", ".join((table.key,) + table.columns)
+            result = self.db.run(
+                f"SELECT {columns} FROM {table.name} LIMIT 1000000", fetch="cursor"
+            )
+            rows = {str(row[0]): tuple(row[1:]) for row in result.fetchall()}
+            with self._lock:
+                self._rows[table.name] = rows
+                self._loaded_at[table.name] = time.time()
+
+    def _table_rows(self, table_name: str) -> Dict[str, Tuple]:
+        loaded_at = self._loaded_at.get(table_name)
+        if loaded_at is None or time.time() - loaded_at >= self.refresh_interval:
+            try:
+                self.refresh(table_name)
+            except SQLAlchemyError:
+                # Stale dimensions are better than none, retry on the next access.
+                if table_name not in self._rows:
+                    raise
+        return self._rows[table_name]
+
+    def lookup(
+        self, table_name: str, column: str, keys: Iterable[Any]
+    ) -> Dict[Any, Any]:
+        """key -> value of `column`, for the keys found in the dimension table (as given)."""
+        index = self.tables[table_name].columns.index(column)
+        rows = self._table_rows(table_name)
+        return {key: rows[str(key)][index] for key in keys if str(key) in rows}
+
+    def decorate_result(self, result: ColumnarResult) -> None:
+        """
+        Adds dimension columns (e.g. user_name, product_description) to a result that
+        contains a fact key column (user_id, product_id), one lookup per key.
+        """
+        lowered = [column.lower() for column in result.columns]
+        # Computed for all tables first, so a failing table leaves the result untouched.
+        columns = []
+        for table in self.tables.values():
+            if table.fact_key not in lowered:
+                continue
+            keys = result.data[lowered.index(table.fact_key)]
+            dimension_rows = self._table_rows(table.name)
+            empty = (None,) * len(table.columns)
+            values = [
+                empty if key is None else dimension_rows.get(str(key), empty)
+                for key in keys
+            ]
+            for i, column in enumerate(table.columns):
+                columns.append(
+                    (table.prefix + column.lower(), [row[i] for row in values])
+                )
+        for name, values in columns:
+            result.add_column(name, values)
+            result.decorated_columns.append(name)
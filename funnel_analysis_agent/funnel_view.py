@@ -0,0 +1,256 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+from langchain_community.utilities import SQLDatabase
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from .router import FUNNEL_STEPS, parse_counts
+
+# New events are fetched at most once a second, answers in between come from memory.
+DEFAULT_REFRESH_INTERVAL_SECONDS = 1.0
+# Every 10 minutes the view is checked against a full FUNNEL_COUNT, and rebuilt if off.
+DEFAULT_RECONCILE_INTERVAL_SECONDS = 600.0
+# Max (user_id, event_type) groups per fetch. Pinot stops adding groups at numGroupsLimit
+# (100k by default) without failing the query, so the limit is raised along with the LIMIT.
+DEFAULT_MAX_GROUPS = 10_000_000
+
+
+def _step_filter(steps: Sequence[str]) -> str:
+    return "event_type IN (" + ", ".join(f"'{step}'" for step in steps) + ")"
+
+
+def funnel_delta_sql(
+    since: Optional[int] = None,
+    steps=FUNNEL_STEPS,
+    max_groups: int = DEFAULT_MAX_GROUPS,
+) -> str:
+    # One row per user and step, however many events there are, so deltas stay small.
+    since_filter = f" AND event_timestamp >= {since}" if since is not None else ""
+    return (
+        f"SELECT user_id, event_type, MAX(event_timestamp) AS last_event "
+        f"FROM clickstream_events WHERE {_step_filter(steps)}{since_filter} "
+        f"GROUP BY user_id, event_type LIMIT {max_groups} "
+        f"OPTION(numGroupsLimit={max_groups})"
+    )
+
+
+def funnel_count_until_sql(until: int, steps=FUNNEL_STEPS) -> str:
+    predicates = ", ".join(f"event_type = '{step}'" for step in steps)
+    return (
+        f"SELECT FUNNEL_COUNT(STEPS({predicates}), CORRELATE_BY(user_id)) AS counts "
+        f"FROM clickstream_events WHERE event_timestamp <= {until}"
+    )
+
+
+def format_funnel(
+    steps: Sequence[str], counts: Sequence[int], watermark: Optional[int]
+) -> str:
+    lines = [
+        "Users per funnel step (users that reached the step and all steps before it), "
+        f"over all events up to event_timestamp {watermark}: "
+        + ", ".join(f"{step}: {count}" for step, count in zip(steps, counts))
+        + "."
+    ]
+    if counts and counts[0]:
+        lines.append(
+            f"Overall conversion rate ({steps[-1]} / {steps[0]}): "
+            f"{counts[-1] / counts[0] * 100:.2f}%."
+        )
+        drops = [counts[i] - counts[i + 1] for i in range(len(counts) - 1)]
+        if drops and max(drops) > 0:
+            i = drops.index(max(drops))
+            lines.append(
+                f"Biggest drop-off: {drops[i]} users, after event_type = {steps[i]}."
+            )
+    return "\n".join(lines)
+
+
+class IncrementalFunnel:
+    """
+    FUNNEL_COUNT over all of clickstream_events, maintained incrementally.
+
+    Keeps the set of funnel steps each user reached (as a bitmask), and the number of
+    users that reached every step up to each step. Only events at or after the
+    `event_timestamp` watermark are fetched from Pinot, and merged into that state;
+    merging is idempotent, so events at the watermark itself can be fetched twice.
+    Every `reconcile_interval` seconds the counts are checked against FUNNEL_COUNT
+    (which also catches late events, older than the watermark), and rebuilt if they differ.
+    """
+
+    def __init__(
+        self,
+        db: SQLDatabase,
+        steps: Sequence[str] = FUNNEL_STEPS,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL_SECONDS,
+        reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL_SECONDS,
+        max_groups: int = DEFAULT_MAX_GROUPS,
+    ):
+        self.db = db
+        self.steps = list(steps)
+        self.refresh_interval = refresh_interval
+        self.reconcile_interval = reconcile_interval
+        self.max_groups = max_groups
+
+        self._step_bits = {step: 1 << i for i, step in enumerate(self.steps)}
+        self._masks: Dict[Any, int] = {}  # user_id -> bitmask of the steps reached
+        self._counts = [0] * len(self.steps)
+        self.watermark: Optional[int] = None  # latest event_timestamp merged
+        self._refreshed_at = 0.0
+        self._reconciled_at = 0.0
+        # One refresh at a time; readers only need the (atomically replaced) counts.
+        self._lock = threading.Lock()
+
+        self.deltas = 0
+        self.rows_merged = 0
+        self.reconciles = 0
+        self.mismatches = 0
+
+    def _depth(self, mask: int) -> int:
+        """Number of consecutive funnel steps reached, from the first one."""
+        depth = 0
+        while depth < len(self.steps) and mask >> depth & 1:
+            depth += 1
+        return depth
+
+    def _merge(self, rows, masks: Dict[Any, int], counts: List[int]) -> Optional[int]:
+        watermark = None
+        for user_id, event_type, last_event in rows:
+            old = masks.get(user_id, 0)
+            new = old | self._step_bits.get(event_type, 0)
+            if new != old:
+                masks[user_id] = new
+                for i in range(self._depth(old), self._depth(new)):
+                    counts[i] += 1
+            if last_event is not None:
+                watermark = (
+                    int(last_event)
+                    if watermark is None
+                    else max(watermark, int(last_event))
+                )
+        return watermark
+
+    def _fetch(self, since: Optional[int]) -> List[tuple]:
+        rows = self.db.run(
+            funnel_delta_sql(since, self.steps, self.max_groups), fetch="cursor"
+        ).fetchall()
+        # A full page means groups were cut off, merging them would undercount for good.
+        if len(rows) >= self.max_groups:
+            raise RuntimeError(
+                f"Funnel view fetch hit the {self.max_groups} groups limit, "
+                "raise max_groups to keep the view"
+            )
+        return rows
+
+    def rebuild(self) -> None:
+        """Recomputes the view from all events."""
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        masks: Dict[Any, int] = {}
+        counts = [0] * len(self.steps)
+        rows = self._fetch(None)
+        watermark = self._merge(rows, masks, counts)
+        self._masks, self._counts, self.watermark = masks, counts, watermark
+        self.rows_merged += len(rows)
+        self._refreshed_at = self._reconciled_at = time.time()
+
+    def refresh(self) -> None:
+        """Merges the events since the watermark into the view."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        if self.watermark is None:
+            self._rebuild()
+            return
+        rows = self._fetch(self.watermark)
+        # Merged into copies and swapped in together, so a failed merge leaves no trace.
+        masks, counts = dict(self._masks), list(self._counts)
+        watermark = self._merge(rows, masks, counts)
+        self._masks, self._counts = masks, counts
+        if watermark is not None:
+            self.watermark = max(self.watermark, watermark)
+        self.deltas += 1
+        self.rows_merged += len(rows)
+        self._refreshed_at = time.time()
+
+    def reconcile(self) -> bool:
+        """
+        Checks the view against FUNNEL_COUNT up to the watermark, rebuilds it if they
+        differ. Returns whether they matched.
+        """
+        with self._lock:
+            return self._reconcile()
+
+    def _reconcile(self) -> bool:
+        self._refresh()
+        self.reconciles += 1
+        self._reconciled_at = time.time()
+        if self.watermark is None:
+            return True
+        rows = self.db.run(
+            funnel_count_until_sql(self.watermark, self.steps), fetch="cursor"
+        ).fetchall()
+        if parse_counts(rows[0][0]) == self._counts:
+            return True
+        self.mismatches += 1
+        self._rebuild()
+        return False
+
+    def counts(self) -> List[int]:
+        """Users that reached each funnel step (and all steps before it), FUNNEL_COUNT style."""
+        now = time.time()
+        if now - self._refreshed_at >= self.refresh_interval:
+            with self._lock:
+                # Re-checked under the lock, another thread may have just refreshed.
+                if self.watermark is None:
+                    self._rebuild()
+                elif now - self._reconciled_at >= self.reconcile_interval:
+                    self._reconcile()
+                elif now - self._refreshed_at >= self.refresh_interval:
+                    self._refresh()
+        return list(self._counts)
+
+    def describe(self, counts: Optional[List[int]] = None) -> str:
+        """The counts, conversion rate and biggest drop-off, as told to the LLM."""
+        counts = self.counts() if counts is None else counts
+        return format_funnel(self.steps, counts, self.watermark)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._masks),
+            "watermark": self.watermark,
+            "deltas": self.deltas,
+            "rows_merged": self.rows_merged,
+            "reconciles": self.reconciles,
+            "mismatches": self.mismatches,
+        }
+
+
+class FunnelCountsInput(BaseModel):
+    pass
+
+
+class FunnelCountsTool(BaseTool):
+    """Tool that answers funnel questions over all events from an IncrementalFunnel."""
+
+    name: str = "funnel_counts"
+    description: str = (
+        "Returns how many users reached each step of the view -> click -> save -> purchase "
+        "funnel over all events of clickstream_events (FUNNEL_COUNT), with the overall "
+        "conversion rate and the biggest drop-off. It is answered instantly from a "
+        "continuously updated view. Takes no input. For a time window or other filters, "
+        "write a FUNNEL_COUNT query instead."
+    )
+    args_schema: Type[BaseModel] = FunnelCountsInput
+    funnel: IncrementalFunnel = Field(exclude=True)
+
+    def _run(self, run_manager=None) -> str:
+        try:
+            return self.funnel.describe()
+        except Exception as e:
+            # Same convention as sql_db_query, so the agent can fall back to a query.
+            return f"Error: {e}"
@@ -1,71 +1,353 @@
-# Local imports
-from finetuned_prompt import finetuned_prompt
-from langchain import hub
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_community.utilities import SQLDatabase
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
-
-# from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
-from pinotdb.sqlalchemy import PinotDialect, PinotHTTPDialect, PinotHTTPSDialect
-from rich.markdown import Markdown
+# Only cheap imports at module level, so that importing the package does no I/O.
+# The DB engine, LLM client and agent are built lazily on first use (see the get_* functions).
+import argparse
+import asyncio
+import functools
+import os
+from functools import lru_cache
+from importlib import resources
+from typing import TYPE_CHECKING
+
 from rich.console import Console
+from rich.markdown import Markdown
 from rich.panel import Panel
+from rich.table import Table
 from rich.text import Text
-from sqlalchemy.dialects import registry
-from dotenv import load_dotenv
-import os
+
+# Local imports
+from .batch import positive_float, positive_int, run_batch
+from .finetuned_prompt import conversation_prompt, finetuned_prompt
+
+if TYPE_CHECKING:
+    from langchain_core.messages import (
+        AIMessage,
+        BaseMessage,
+        HumanMessage,
+        ToolMessage,
+    )
+
+# Version of the bundled copy of the "langchain-ai/sql-agent-system-prompt" hub prompt.
+SYSTEM_PROMPT_VERSION = "v1"
+HUB_SYSTEM_PROMPT = "langchain-ai/sql-agent-system-prompt"
+
+# Initialize a Rich Console for pretty console outputs
+console = Console()
+
 
 # Initialize Agent and Prompt
 
-load_dotenv(".env")
-registry.register("pinot", "pinotdb.sqlalchemy", "PinotDialect")
-PinotDialect.supports_statement_cache = False
-PinotHTTPSDialect.supports_statement_cache = False
 
-db = SQLDatabase.from_uri(os.environ["PINOT_SQLALCHEMY_URI"])
+@lru_cache(maxsize=None)
+def load_env():
+    from dotenv import load_dotenv
 
-llm = ChatOpenAI(
-    api_key=os.environ["OPENAI_API_KEY"], model="gpt-4o-mini", temperature=0
-)
+    load_dotenv(".env")
 
-toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-# print(toolkit.get_tools())
 
-# Pull prompt
-prompt_template = hub.pull("langchain-ai/sql-agent-system-prompt")
+@lru_cache(maxsize=None)
+def get_db():
+    from pinotdb.sqlalchemy import PinotDialect, PinotHTTPSDialect
+    from sqlalchemy.dialects import registry
 
-system_message = (
-    prompt_template.format(dialect="Apache Pinot MYSQL_ANSI dialect", top_k=3)
-    + finetuned_prompt
-)
-# print(system_message)
+    from .schema_cache import DEFAULT_TTL_SECONDS, CachedSQLDatabase
 
+    load_env()
+    registry.register("pinot", "pinotdb.sqlalchemy", "PinotDialect")
+    PinotDialect.supports_statement_cache = False
+    PinotHTTPSDialect.supports_statement_cache = False
 
-# Initialize a Rich Console for pretty console outputs
-console = Console()
+    # Table names and schemas are cached (optionally snapshotted to disk), and injected
+    # into the system message so the agent doesn't have to introspect Pinot on every question.
+    return CachedSQLDatabase.from_uri(
+        os.environ["PINOT_SQLALCHEMY_URI"],
+        ttl_seconds=float(
+            os.environ.get("SCHEMA_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+        ),
+        snapshot_path=os.environ.get("SCHEMA_CACHE_SNAPSHOT_PATH"),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_llm():
+    # from langchain_ollama import ChatOllama
+    from langchain_openai import ChatOpenAI
+
+    load_env()
+    return ChatOpenAI(
+        api_key=os.environ["OPENAI_API_KEY"], model="gpt-4o-mini", temperature=0
+    )
+
+
+@lru_cache(maxsize=None)
+def get_result_cache():
+    from .result_cache import (
+        DEFAULT_MAX_CACHED_ROWS,
+        QueryResultCache,
+        pinot_watermark_fn,
+    )
+
+    # Serve repeated queries from memory, until the table's max age or watermark says otherwise.
+    return QueryResultCache(
+        max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 256)),
+        max_rows=int(os.environ.get("RESULT_CACHE_MAX_ROWS", DEFAULT_MAX_CACHED_ROWS)),
+        watermark_fn=pinot_watermark_fn(get_db()),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_result_store():
+    from .query_results import ResultStore
+
+    # Full results of the latest queries, for rendering and export. The LLM only sees previews.
+    return ResultStore(max_entries=int(os.environ.get("RESULT_STORE_MAX_ENTRIES", 32)))
+
+
+@lru_cache(maxsize=None)
+def get_dimensions():
+    from .dimensions import DEFAULT_REFRESH_INTERVAL_SECONDS, DimensionStore
+
+    # Users and NewProducts are kept in memory, so results can be decorated with
+    # names and descriptions locally instead of with LOOKUPs or follow-up queries.
+    return DimensionStore(
+        get_db(),
+        refresh_interval=float(
+            os.environ.get(
+                "DIMENSION_REFRESH_INTERVAL_SECONDS", DEFAULT_REFRESH_INTERVAL_SECONDS
+            )
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_funnel_view():
+    from .funnel_view import (
+        DEFAULT_MAX_GROUPS,
+        DEFAULT_RECONCILE_INTERVAL_SECONDS,
+        DEFAULT_REFRESH_INTERVAL_SECONDS,
+        IncrementalFunnel,
+    )
+
+    # Funnel counts over all events, kept up to date from the new events only.
+    return IncrementalFunnel(
+        get_db(),
+        refresh_interval=float(
+            os.environ.get(
+                "FUNNEL_REFRESH_INTERVAL_SECONDS", DEFAULT_REFRESH_INTERVAL_SECONDS
+            )
+        ),
+        reconcile_interval=float(
+            os.environ.get(
+                "FUNNEL_RECONCILE_INTERVAL_SECONDS", DEFAULT_RECONCILE_INTERVAL_SECONDS
+            )
+        ),
+        max_groups=int(os.environ.get("FUNNEL_MAX_GROUPS", DEFAULT_MAX_GROUPS)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_router():
+    from .router import (
+        PRODUCT_CATEGORY_COLUMN,
+        PURCHASE_PRODUCT_COLUMN,
+        PURCHASE_QUANTITY_COLUMN,
+        FastPathRouter,
+    )
+
+    return FastPathRouter(
+        get_db(),
+        dimensions=get_dimensions(),
+        funnel=get_funnel_view(),
+        category_column=os.environ.get(
+            "PRODUCT_CATEGORY_COLUMN", PRODUCT_CATEGORY_COLUMN
+        ),
+        purchase_product_column=os.environ.get(
+            "PURCHASE_PRODUCT_COLUMN", PURCHASE_PRODUCT_COLUMN
+        ),
+        purchase_quantity_column=os.environ.get(
+            "PURCHASE_QUANTITY_COLUMN", PURCHASE_QUANTITY_COLUMN
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_recommender():
+    from .recommendations import (
+        DEFAULT_INDEX_REFRESH_INTERVAL_SECONDS,
+        LocalEmbeddingIndex,
+        ProductRecommender,
+    )
+
+    # The local NumPy index avoids a Pinot vector search per user, at the cost of
+    # holding all product embeddings in memory.
+    local_index = (
+        LocalEmbeddingIndex(
+            get_db(),
+            refresh_interval=float(
+                os.environ.get(
+                    "RECOMMENDER_INDEX_REFRESH_INTERVAL_SECONDS",
+                    DEFAULT_INDEX_REFRESH_INTERVAL_SECONDS,
+                )
+            ),
+        )
+        if os.environ.get("RECOMMENDER_LOCAL_INDEX", "0") == "1"
+        else None
+    )
+    return ProductRecommender(get_db(), local_index=local_index)
+
+
+def build_tools(
+    db, llm, result_cache, dimensions, recommender, results=None, funnel=None
+):
+    from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+
+    from .funnel_view import FunnelCountsTool
+    from .query_checker import with_local_query_checker
+    from .recommendations import RecommendProductsTool
+    from .result_cache import with_result_cache
+
+    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+    tools = with_result_cache(
+        toolkit.get_tools(), result_cache, dimensions=dimensions, results=results
+    )
+    # Checks queries locally against the Pinot rules and the schema, instead of with an LLM call.
+    tools = with_local_query_checker(tools, schema_fn=db.get_table_columns)
+    tools = tools + [RecommendProductsTool(recommender=recommender)]
+    if funnel is not None:
+        tools.append(FunnelCountsTool(funnel=funnel))
+    return tools
+
+
+@lru_cache(maxsize=None)
+def get_tools():
+    return build_tools(
+        get_db(),
+        get_llm(),
+        get_result_cache(),
+        get_dimensions(),
+        get_recommender(),
+        results=get_result_store(),
+        funnel=get_funnel_view(),
+    )
+
+
+def load_system_prompt_template(source: str = None) -> str:
+    """
+    The base SQL agent system prompt, from the bundled versioned copy by default.
+    Pass source="hub" (or set SYSTEM_PROMPT_SOURCE=hub) to pull the latest one from LangChain hub.
+    """
+    source = source or os.environ.get("SYSTEM_PROMPT_SOURCE", "bundled")
+    if source == "hub":
+        from langchain import hub
+
+        return hub.pull(HUB_SYSTEM_PROMPT).messages[0].prompt.template
+
+    prompt_file = f"sql_agent_system_prompt_{SYSTEM_PROMPT_VERSION}.txt"
+    return (
+        resources.files(__package__)
+        .joinpath("prompts", prompt_file)
+        .read_text(encoding="utf-8")
+    )
 
-# print prompt
-console.print(
-    Panel(
-        system_message,
-        width=console.width,
-        style="bold cyan",
-    ),
-    style="bold cyan",
-)
 
-# Create agent
-agent_executor = create_react_agent(
-    llm, toolkit.get_tools(), state_modifier=system_message
-)
+def build_system_message(db, prompt_source: str = None, template: str = None) -> str:
+    if template is None:
+        template = load_system_prompt_template(prompt_source)
+    return (
+        template.format(dialect="Apache Pinot MYSQL_ANSI dialect", top_k=3)
+        + finetuned_prompt
+        + db.schema_prompt()
+        + conversation_prompt
+    )
+
+
+@lru_cache(maxsize=None)
+def get_system_prompt_template() -> str:
+    return load_system_prompt_template()
+
+
+def get_system_message() -> str:
+    # Not cached as a whole: the schema part comes from the db's metadata cache, so the
+    # message follows schema changes once that cache is invalidated or expires.
+    return build_system_message(get_db(), template=get_system_prompt_template())
+
+
+def build_agent(llm, tools, system_message, checkpointer=None, token_budget=None):
+    from langgraph.prebuilt import create_react_agent
+
+    from .sessions import DEFAULT_HISTORY_TOKEN_BUDGET, compacting_state_modifier
+
+    # Older tool outputs are compacted before every LLM call once the history gets too long.
+    return create_react_agent(
+        llm,
+        tools,
+        state_modifier=compacting_state_modifier(
+            system_message, token_budget or DEFAULT_HISTORY_TOKEN_BUDGET
+        ),
+        checkpointer=checkpointer,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_agent():
+    # Create agent
+    return build_agent(get_llm(), get_tools(), get_system_message)
+
+
+@lru_cache(maxsize=None)
+def get_session(fast_path: bool = True):
+    from langgraph.checkpoint.memory import MemorySaver
+
+    from .sessions import DEFAULT_HISTORY_TOKEN_BUDGET, Session
+
+    # The conversation history is kept in memory by the checkpointer, per session thread.
+    token_budget = int(
+        os.environ.get("SESSION_TOKEN_BUDGET", DEFAULT_HISTORY_TOKEN_BUDGET)
+    )
+    agent = build_agent(
+        get_llm(),
+        get_tools(),
+        get_system_message,
+        checkpointer=MemorySaver(),
+        token_budget=token_budget,
+    )
+    return Session(
+        agent, router=get_router() if fast_path else None, token_budget=token_budget
+    )
 
 
 # Ask Questions to the Agent
 
 
-def print_results(events):
+# Rows of a query result printed to the console, the rest can be exported with --export-dir.
+RENDERED_ROWS = 50
+
+
+def render_result(result, console: Console = console, max_rows: int = RENDERED_ROWS):
+    table = Table(*result.columns, style="green")
+    for row in result.rows(stop=max_rows):
+        table.add_row(*(str(value) for value in row))
+    if result.row_count > max_rows:
+        table.caption = f"... {result.row_count - max_rows} more rows" + (
+            " (the result was cut off at the row limit)" if result.truncated else ""
+        )
+    console.print(table)
+
+
+def export_result(result, result_id: str, export_dir: str) -> str:
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, f"result_{result_id}.csv")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        result.to_csv(f)
+    return path
+
+
+def print_results(
+    events, console: Console = console, results=None, export_dir: str = None
+):
+    """
+    Prints the streamed agent events. With the ResultStore of the sql_db_query tool,
+    query results are rendered as tables (and exported as CSV to `export_dir`).
+    """
     # stream output
     for event in events:
         last_message = event["messages"][-1]
@@ -103,14 +385,42 @@ def print_results(events):
             ]:
                 continue
             elif last_message.name == "sql_db_query":
+                result = (
+                    results.get(last_message.artifact) if results is not None else None
+                )
+                if result is None or result.row_count == 0:
+                    # Display the SQL Query Result, as the LLM saw it
+                    console.print(
+                        Text(
+                            f"Query Result:\n{last_message.content}", style="bold green"
+                        )
+                    )
+                    continue
+                console.print(
+                    Text(f"Query Result ({result.row_count} rows):", style="bold green")
+                )
+                # Display the full SQL Query Result
+                render_result(result, console)
+                if export_dir:
+                    path = export_result(result, last_message.artifact, export_dir)
+                    console.print(f"Exported to {path}", style="dim")
+                continue
+            elif last_message.name == "recommend_products":
+                to_print = Text(
+                    f"Recommendations:\n{last_message.content}", style="bold green"
+                )
+                # Display the recommended products
+                console.print(to_print)
+                continue
+            elif last_message.name == "funnel_counts":
                 to_print = Text(
-                    f"Query Result:\n{last_message.content}", style="bold green"
+                    f"Funnel Counts:\n{last_message.content}", style="bold green"
                 )
-                # Display the SQL Query Result
+                # Display the materialized funnel counts
                 console.print(to_print)
                 continue
         else:
-            print("Unknown Message Type, just printing out as it is.")
+            console.print("Unknown Message Type, just printing out as it is.")
 
         to_print = (
             Markdown(f"Agent: {last_message.content}")
@@ -122,16 +432,45 @@ def print_results(events):
         console.print(to_print, markup=True, highlight=True)
 
 
-def invoke_model(user_input: str):
+def invoke_model(
+    user_input: str,
+    fast_path: bool = True,
+    trace_sink=None,
+    session=None,
+    export_dir: str = None,
+):
     print("You:", user_input)
 
-    # invoke model
-    events = agent_executor.stream(
-        {"messages": [("user", user_input)]},
-        stream_mode="values",
-    )
+    tracer = None
+    if trace_sink is not None:
+        from .tracing import RunTracer
+
+        # records a span per LLM turn and tool call, see tracing.RunTracer
+        tracer = RunTracer(user_input)
+
+    # canonical funnel questions are answered directly, without the LLM
+    events = None
+    if session is not None:
+        # earlier questions and results of the session are passed along as context
+        events = session.stream(user_input, tracer)
+    elif fast_path:
+        from .tracing import optional_span
+
+        with optional_span(tracer, "fast_path", "router"):
+            events = get_router().answer(user_input)
+
+    if events is None:
+        # invoke model
+        events = get_agent().stream(
+            {"messages": [("user", user_input)]},
+            config={"callbacks": [tracer]} if tracer is not None else None,
+            stream_mode="values",
+        )
+
+    print_results(events, results=get_result_store(), export_dir=export_dir)
 
-    print_results(events)
+    if tracer is not None:
+        trace_sink.record(tracer.summary())
 
 
 input_prompts = [
@@ -142,7 +481,125 @@ input_prompts = [
     "What are the top 5 electronic items sold?",
 ]
 
-for i, user_input in enumerate(input_prompts, 1):
-    print(f"Question #{i}:", user_input)
-    result = invoke_model(user_input)
-    print(result)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Funnel Analysis Agent")
+    parser.add_argument(
+        "questions",
+        nargs="*",
+        help="Questions to ask the agent. Defaults to the demo questions.",
+    )
+    parser.add_argument(
+        "--questions-file", help="File with one question per line to ask the agent."
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Answer all questions concurrently instead of one after another.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="Max number of questions answered at once in batch mode.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=positive_float,
+        default=120.0,
+        help="Per-question timeout in seconds in batch mode.",
+    )
+    parser.add_argument(
+        "--no-fast-path",
+        action="store_true",
+        help="Send every question to the agent, even the canonical funnel questions.",
+    )
+    parser.add_argument(
+        "--no-session",
+        action="store_true",
+        help="Answer every question on its own, without earlier questions and results "
+        "as context. Batch mode always answers questions on their own.",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Append a JSON line with the latency breakdown and token counts of each question.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Write Prometheus-style metrics (latency quantiles, per-stage time, tokens) here.",
+    )
+    parser.add_argument(
+        "--export-dir",
+        help="Write the full result of every query as a CSV file into this directory.",
+    )
+    parser.add_argument(
+        "--show-prompt",
+        action="store_true",
+        help="Print the full system message before answering.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    questions = list(args.questions)
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            questions += [line.strip() for line in f if line.strip()]
+    questions = questions or input_prompts
+
+    trace_sink = None
+    if args.trace_file or args.metrics_file:
+        from .tracing import TraceSink
+
+        trace_sink = TraceSink(args.trace_file)
+
+    if args.show_prompt:
+        # print prompt
+        console.print(
+            Panel(
+                get_system_message(),
+                width=console.width,
+                style="bold cyan",
+            ),
+            style="bold cyan",
+        )
+
+    if args.batch:
+        asyncio.run(
+            run_batch(
+                get_agent(),
+                questions,
+                render=functools.partial(
+                    print_results,
+                    results=get_result_store(),
+                    export_dir=args.export_dir,
+                ),
+                console=console,
+                concurrency=args.concurrency,
+                timeout=args.timeout,
+                router=None if args.no_fast_path else get_router(),
+                trace_sink=trace_sink,
+            )
+        )
+    else:
+        session = None if args.no_session else get_session(not args.no_fast_path)
+        for i, user_input in enumerate(questions, 1):
+            print(f"Question #{i}:", user_input)
+            result = invoke_model(
+                user_input,
+                fast_path=not args.no_fast_path,
+                trace_sink=trace_sink,
+                session=session,
+                export_dir=args.export_dir,
+            )
+            print(result)
+
+    console.print(f"Result cache stats: {get_result_cache().stats()}")
+    if args.metrics_file:
+        trace_sink.write_prometheus(args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+import difflib
+import json
+import re
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Type
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+# Database name that must prefix dimension tables in LOOKUP, see finetuned_prompt item 6.
+PINOT_DATABASE = "ws_2opqcdizwoh9"
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<qident>"(?:[^"]|"")*"|`[^`]*`)
+    | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<ident>[A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)*)
+    | (?P<op><>|!=|>=|<=|\|\||[-+*/%=<>(),;\[\]])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_KEYWORDS = set("""
+    select from where group by order having limit offset as and or not in is null like
+    between asc desc distinct case when then else end true false option all any exists
+    escape nulls first last array interval join inner outer left right full cross on
+    using union intersect except with over partition rows range preceding following
+    unbounded current row filter
+    current_date current_time current_timestamp
+    year quarter month week day hour minute second millisecond microsecond nanosecond
+    doy dow epoch decade century millennium
+    int integer bigint long float double decimal boolean string varchar char timestamp
+    bytes json
+    """.split())
+_DML_KEYWORDS = set(
+    "insert update delete drop create alter truncate replace merge grant revoke".split()
+)
+_CLAUSES = (
+    "select",
+    "from",
+    "where",
+    "group by",
+    "having",
+    "order by",
+    "limit",
+    "option",
+)
+
+
+@dataclass
+class Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+    depth: int  # parenthesis depth the token sits at
+
+    @property
+    def lower(self) -> str:
+        return self.text.lower()
+
+
+@dataclass
+class QueryIssue:
+    code: str
+    message: str
+    hint: str = ""
+
+
+def tokenize(query: str) -> List[Token]:
+    tokens, depth, pos = [], 0, 0
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if match is None:
+            raise ValueError(f"Unexpected character {query[pos]!r} at position {pos}")
+        kind, text = match.lastgroup, match.group()
+        pos = match.end()
+        if kind in ("ws", "comment"):
+            continue
+        if text == ")":
+            depth -= 1
+        tokens.append(Token(kind, text, match.start(), match.end(), depth))
+        if text == "(":
+            depth += 1
+    return tokens
+
+
+def _split_clauses(tokens: List[Token]) -> Dict[str, List[Token]]:
+    """Top level (depth 0) clauses of a SELECT statement, e.g. {"where": [...]}."""
+    clauses: Dict[str, List[Token]] = {}
+    current = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.depth == 0 and token.kind == "ident":
+            two_words = (
+                f"{token.lower} {tokens[i + 1].lower}" if i + 1 < len(tokens) else ""
+            )
+            if two_words in _CLAUSES:
+                current = two_words
+                clauses[current] = []
+                i += 2
+                continue
+            if token.lower in _CLAUSES:
+                current = token.lower
+                clauses[current] = []
+                i += 1
+                continue
+        if current is not None:
+            clauses[current].append(token)
+        i += 1
+    return clauses
+
+
+def _ends_expression(token: Token) -> bool:
+    return (
+        token.text == ")"
+        or token.lower == "end"
+        or (
+            token.kind in ("ident", "qident", "number", "string")
+            and token.lower not in _KEYWORDS
+        )
+    )
+
+
+def _select_aliases(query: str, select_tokens: List[Token]) -> Dict[str, str]:
+    """alias (lowercase) -> the select expression it names, with or without AS."""
+    aliases = {}
+    items, item = [], []
+    for token in select_tokens:
+        if token.depth == 0 and token.text == ",":
+            items.append(item)
+            item = []
+        else:
+            item.append(token)
+    items.append(item)
+
+    for item in items:
+        if len(item) < 2:
+            continue
+        last, previous = item[-1], item[-2]
+        if last.kind not in ("ident", "qident") or last.lower in _KEYWORDS:
+            continue
+        if previous.lower == "as" and len(item) > 2:
+            end = previous
+        elif previous.depth == 0 and _ends_expression(previous):
+            # Calcite takes an identifier right after an expression as its alias,
+            # e.g. SUM(duration) total
+            end = last
+        else:
+            continue
+        alias = last.text.strip('"`')
+        aliases[alias.lower()] = query[item[0].start : end.start].strip()
+    return aliases
+
+
+def _lookup_calls(tokens: List[Token]) -> List[List[Token]]:
+    """Arguments (top level tokens only) of every LOOKUP(...) call."""
+    calls = []
+    for i, token in enumerate(tokens):
+        if (
+            token.lower == "lookup"
+            and i + 1 < len(tokens)
+            and tokens[i + 1].text == "("
+        ):
+            depth = tokens[i + 1].depth + 1
+            args = []
+            for arg in tokens[i + 2 :]:
+                if arg.depth < depth:
+                    break
+                if arg.depth == depth and arg.text != ",":
+                    args.append(arg)
+            calls.append(args)
+    return calls
+
+
+def _close_matches(name: str, candidates: List[str]) -> str:
+    matches = difflib.get_close_matches(name, candidates, n=3, cutoff=0.6)
+    return f" Did you mean: {', '.join(matches)}?" if matches else ""
+
+
+def check_query(
+    query: str, schema: Optional[Dict[str, List[str]]] = None
+) -> List[QueryIssue]:
+    """
+    Checks a query against the Pinot rules of finetuned_prompt.py, and against the known
+    schema (table -> column names) when given. Returns an empty list for a valid query.
+    """
+    try:
+        tokens = tokenize(query.strip().rstrip(";"))
+    except ValueError as e:
+        return [QueryIssue("syntax", str(e))]
+    if not tokens:
+        return [QueryIssue("syntax", "The query is empty.")]
+
+    issues = []
+    if sum(t.text == "(" for t in tokens) != sum(t.text == ")" for t in tokens):
+        issues.append(QueryIssue("syntax", "Unbalanced parentheses."))
+    if any(t.text == ";" for t in tokens):
+        issues.append(
+            QueryIssue(
+                "multiple_statements",
+                "Only a single statement can be executed.",
+                "Remove everything after the first ';'.",
+            )
+        )
+
+    words = {t.lower for t in tokens if t.kind == "ident"}
+    if tokens[0].lower in _DML_KEYWORDS:
+        return issues + [
+            QueryIssue(
+                "not_select",
+                f"{tokens[0].text.upper()} statements are not allowed.",
+                "Only SELECT queries can be executed.",
+            )
+        ]
+    if tokens[0].lower != "select":
+        return issues + [
+            QueryIssue(
+                "not_select",
+                "The query must start with SELECT.",
+                "Common table expressions (WITH) are subqueries, which Pinot does not support.",
+            )
+        ]
+
+    if "join" in words:
+        issues.append(
+            QueryIssue(
+                "join",
+                "JOINs are not supported.",
+                "Use LOOKUP('<database>.<dimTable>', 'dimColumn', 'dimKey', factKey) "
+                "to get dimensional info instead.",
+            )
+        )
+    if sum(t.lower == "select" for t in tokens) > 1:
+        issues.append(
+            QueryIssue(
+                "subquery",
+                "Subqueries are not supported.",
+                "Run the inner query first, and use its result as literal values.",
+            )
+        )
+    for word in ("union", "intersect", "except"):
+        if word in words:
+            issues.append(
+                QueryIssue(
+                    "set_operation",
+                    f"{word.upper()} is not supported.",
+                    "Run the queries separately.",
+                )
+            )
+
+    clauses = _split_clauses(tokens)
+    aliases = _select_aliases(query, clauses.get("select", []))
+
+    lookups = _lookup_calls(tokens)
+    if lookups and "group by" in clauses:
+        issues.append(
+            QueryIssue(
+                "lookup_with_group_by",
+                "LOOKUP cannot be combined with GROUP BY.",
+                "Remove the LOOKUP and group by the fact columns only, user_id and "
+                "product_id results are decorated with names automatically.",
+            )
+        )
+
+    known = {table.lower(): table for table in (schema or {})}
+    for args in lookups:
+        if not args or args[0].kind != "string":
+            issues.append(
+                QueryIssue(
+                    "lookup_arguments",
+                    "The first LOOKUP argument must be the dimension table name as a string.",
+                )
+            )
+            continue
+        table = args[0].text.strip("'")
+        if "." not in table:
+            issues.append(
+                QueryIssue(
+                    "lookup_database_prefix",
+                    f"LOOKUP table '{table}' is missing the database prefix.",
+                    f"Use '{PINOT_DATABASE}.{table}'.",
+                )
+            )
+        table_name = table.split(".")[-1]
+        if schema and table_name.lower() not in known:
+            issues.append(
+                QueryIssue(
+                    "unknown_table",
+                    f"Unknown dimension table '{table_name}' in LOOKUP.",
+                    _close_matches(table_name, list(schema)).strip(),
+                )
+            )
+            continue
+        if schema:
+            dim_columns = schema[known[table_name.lower()]]
+            lowered = {c.lower() for c in dim_columns}
+            # LOOKUP('table', 'dimColumn', 'dimKey1', factValue1, 'dimKey2', factValue2 ...)
+            for arg in args[1:2] + args[2::2]:
+                column = arg.text.strip("'")
+                if arg.kind == "string" and column.lower() not in lowered:
+                    issues.append(
+                        QueryIssue(
+                            "unknown_column",
+                            f"Unknown column '{column}' of '{table_name}' in LOOKUP.",
+                            _close_matches(column, dim_columns).strip(),
+                        )
+                    )
+
+    for clause in ("where", "group by", "order by", "having"):
+        for token in clauses.get(clause, []):
+            name = token.text.strip('"`').lower()
+            if token.kind in ("ident", "qident") and name in aliases:
+                # An alias with the same name as a real column is just the column.
+                if schema and any(
+                    name in (c.lower() for c in cols) for cols in schema.values()
+                ):
+                    continue
+                issues.append(
+                    QueryIssue(
+                        "alias_in_clause",
+                        f"Column alias '{token.text}' is used in {clause.upper()}.",
+                        f"Use the expression instead: {aliases[name]}",
+                    )
+                )
+
+    if not clauses.get("from"):
+        issues.append(
+            QueryIssue(
+                "no_from_clause",
+                "The query has no FROM clause, Pinot can't run queries without a table.",
+                "Select from a table, e.g. FROM clickstream_events.",
+            )
+        )
+    # Names can only be resolved in the supported single-table query shape.
+    elif schema and not issues:
+        issues += _check_names(tokens, clauses, aliases, schema, known)
+
+    return issues
+
+
+def _check_names(tokens, clauses, aliases, schema, known) -> List[QueryIssue]:
+    issues = []
+    from_tokens = [t for t in clauses["from"] if t.kind in ("ident", "qident")]
+    table_name = from_tokens[0].text.strip('"`').split(".")[-1]
+    if table_name.lower() not in known:
+        return [
+            QueryIssue(
+                "unknown_table",
+                f"Unknown table '{table_name}'.",
+                _close_matches(table_name, list(schema)).strip(),
+            )
+        ]
+    columns = schema[known[table_name.lower()]]
+    lowered_columns = {c.lower() for c in columns}
+
+    # Query options, e.g. OPTION(timeoutMs=1000), are not columns.
+    skipped = {id(t) for t in from_tokens + clauses.get("option", [])}
+    reported = set()
+    for i, token in enumerate(tokens):
+        if token.kind not in ("ident", "qident") or id(token) in skipped:
+            continue
+        name = token.text.strip('"`').split(".")[-1]
+        is_function = i + 1 < len(tokens) and tokens[i + 1].text == "("
+        after_as = i > 0 and tokens[i - 1].lower == "as"
+        if (
+            is_function
+            or after_as
+            or (token.kind == "ident" and name.lower() in _KEYWORDS)
+            or name.lower() in aliases
+            or name.lower() in lowered_columns
+            or name.lower() in reported
+        ):
+            continue
+        reported.add(name.lower())
+        issues.append(
+            QueryIssue(
+                "unknown_column",
+                f"Unknown column '{name}' in table '{known[table_name.lower()]}'.",
+                _close_matches(name, columns).strip()
+                or f"Available columns: {', '.join(columns)}",
+            )
+        )
+    return issues
+
+
+def format_issues(issues: List[QueryIssue]) -> str:
+    return json.dumps(
+        {"valid": False, "errors": [asdict(issue) for issue in issues]}, indent=2
+    )
+
+
+class QueryCheckerInput(BaseModel):
+    query: str = Field(description="A detailed and correct SQL query.")
+
+
+class LocalQueryCheckerTool(BaseTool):
+    """
+    Drop-in replacement for the toolkit's LLM based `sql_db_query_checker`: checks the
+    query locally in milliseconds, instead of with an extra LLM call.
+    """
+
+    name: str = "sql_db_query_checker"
+    description: str = (
+        "Use this tool to double check if your query is correct before executing it. "
+        "Always use this tool before executing a query with sql_db_query! "
+        "Returns the query unchanged if it is valid, otherwise a JSON list of errors "
+        "with hints on how to fix them."
+    )
+    args_schema: Type[BaseModel] = QueryCheckerInput
+    # Returns table -> column names, e.g. CachedSQLDatabase.get_table_columns
+    schema_fn: Optional[Callable[[], Dict[str, List[str]]]] = Field(
+        default=None, exclude=True
+    )
+
+    def _run(self, query: str, run_manager=None) -> str:
+        try:
+            schema = self.schema_fn() if self.schema_fn else None
+        except Exception:
+            # Without a schema the Pinot rules can still be checked.
+            schema = None
+        issues = check_query(query, schema)
+        return format_issues(issues) if issues else query
+
+
+def with_local_query_checker(
+    tools: List[BaseTool],
+    schema_fn: Optional[Callable[[], Dict[str, List[str]]]] = None,
+) -> List[BaseTool]:
+    """Replaces the toolkit's LLM based `sql_db_query_checker` with LocalQueryCheckerTool."""
+    return [
+        (
+            LocalQueryCheckerTool(schema_fn=schema_fn)
+            if tool.name == "sql_db_query_checker"
+            else tool
+        )
+        for tool in tools
+    ]
@@ -0,0 +1,181 @@
+import csv
+import itertools
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_community.utilities import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy import text
+
+# Rows kept per result. A careless query over clickstream_events stops here, instead of
+# pulling the whole table into memory.
+DEFAULT_MAX_ROWS = 100_000
+# Rows fetched from the cursor at a time.
+DEFAULT_FETCH_BATCH_SIZE = 1_000
+# Rows of a result shown to the LLM, bigger results come with column statistics instead.
+DEFAULT_PREVIEW_ROWS = 20
+# Most frequent values listed per text column in the statistics.
+TOP_VALUES = 3
+
+
+class ColumnarResult:
+    """
+    A query result kept column by column, as filled from the cursor.
+
+    The LLM only sees `preview()`, a capped number of rows plus statistics of each
+    column over the whole result. The full result stays here, for rendering and export.
+    """
+
+    def __init__(self, query: str, columns: List[str]):
+        self.query = query
+        self.columns = list(columns)
+        self.data: List[List[Any]] = [[] for _ in self.columns]
+        self.row_count = 0
+        self.truncated = False  # True if the query returned more than max_rows rows
+        # Columns added by DimensionStore.decorate_result, e.g. "user_name"
+        self.decorated_columns: List[str] = []
+
+    def append_rows(self, rows) -> None:
+        for row in rows:
+            for column, value in zip(self.data, row):
+                column.append(value)
+            self.row_count += 1
+
+    def add_column(self, name: str, values: List[Any]) -> None:
+        self.columns.append(name)
+        self.data.append(values)
+
+    def column(self, name: str) -> List[Any]:
+        return self.data[self.columns.index(name)]
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple]:
+        """Rows as tuples, assembled on the fly from the columns."""
+        return itertools.islice(zip(*self.data), start, stop)
+
+    def column_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {}
+        for name, values in zip(self.columns, self.data):
+            present = [value for value in values if value is not None]
+            column = {"nulls": len(values) - len(present)}
+            if present and all(
+                isinstance(value, (int, float)) and not isinstance(value, bool)
+                for value in present
+            ):
+                column.update(min=min(present), max=max(present))
+            elif present:
+                counts = Counter(str(value) for value in present)
+                column.update(
+                    distinct=len(counts), top_values=counts.most_common(TOP_VALUES)
+                )
+            stats[name] = column
+        return stats
+
+    def _format_rows(self, stop: int, max_string_length: int) -> str:
+        rows = [
+            tuple(truncate_word(value, length=max_string_length) for value in row)
+            for row in self.rows(stop=stop)
+        ]
+        # Decorated results carry their column names, so the LLM can tell the extra columns apart.
+        if self.decorated_columns:
+            return str([dict(zip(self.columns, row)) for row in rows])
+        return str(rows)
+
+    def preview(
+        self, max_rows: int = DEFAULT_PREVIEW_ROWS, max_string_length: int = 300
+    ) -> str:
+        """
+        What the LLM gets to see: small results in full, in the same format as
+        SQLDatabase.run, and the first `max_rows` rows plus column statistics otherwise.
+        """
+        if self.row_count == 0:
+            return ""
+        if self.row_count <= max_rows and not self.truncated:
+            return self._format_rows(max_rows, max_string_length)
+
+        lines = [
+            f"{self.row_count} rows"
+            + (
+                " (stopped reading there, the query returned more - aggregate or add a LIMIT)"
+                if self.truncated
+                else ""
+            )
+            + f", showing the first {max_rows}.",
+            f"Columns: {', '.join(self.columns)}",
+            f"First rows: {self._format_rows(max_rows, max_string_length)}",
+            "Column statistics over all rows:",
+        ]
+        for name, stats in self.column_stats().items():
+            parts = []
+            if "min" in stats:
+                parts.append(f"min {stats['min']}, max {stats['max']}")
+            if "distinct" in stats:
+                top = ", ".join(
+                    f"{truncate_word(value, length=50)} ({count})"
+                    for value, count in stats["top_values"]
+                )
+                parts.append(f"{stats['distinct']} distinct, most frequent: {top}")
+            parts.append(f"{stats['nulls']} nulls")
+            lines.append(f"- {name}: " + "; ".join(parts))
+        return "\n".join(lines)
+
+    def to_csv(self, file: IO[str]) -> None:
+        writer = csv.writer(file)
+        writer.writerow(self.columns)
+        writer.writerows(self.rows())
+
+
+def stream_query(
+    db: SQLDatabase,
+    query: str,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    batch_size: int = DEFAULT_FETCH_BATCH_SIZE,
+) -> ColumnarResult:
+    """
+    Runs a query and streams its rows from the cursor into a ColumnarResult, in batches
+    of `batch_size` rows, stopping after `max_rows` rows. Raises SQLAlchemyError.
+    """
+    with db._engine.connect() as connection:
+        cursor = connection.execute(text(query))
+        if not cursor.returns_rows:
+            return ColumnarResult(query, [])
+
+        result = ColumnarResult(query, list(cursor.keys()))
+        while result.row_count < max_rows:
+            rows = cursor.fetchmany(min(batch_size, max_rows - result.row_count))
+            if not rows:
+                break
+            result.append_rows(rows)
+        result.truncated = (
+            result.row_count >= max_rows and cursor.fetchone() is not None
+        )
+        cursor.close()
+    return result
+
+
+class ResultStore:
+    """
+    Bounded LRU of the latest query results, by id. Tool messages only carry the id
+    (as their artifact), so the full results are never copied into the agent state.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, ColumnarResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result: ColumnarResult) -> str:
+        result_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._results[result_id] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result_id
+
+    def get(self, result_id: Any) -> Optional[ColumnarResult]:
+        with self._lock:
+            result = self._results.get(result_id)
+            if result is not None:
+                self._results.move_to_end(result_id)
+            return result
@@ -0,0 +1,265 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from langchain_community.utilities import SQLDatabase
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import SQLAlchemyError
+
+# A product row: (ID, Name, Description)
+Product = Tuple[str, str, str]
+
+# Products are added now and then, reloading the local index every 10 minutes is plenty.
+DEFAULT_INDEX_REFRESH_INTERVAL_SECONDS = 600.0
+
+
+def _quote_list(values: Sequence[Any]) -> str:
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+
+def _parse_embedding(value: Any) -> List[float]:
+    # Pinot hands back arrays as lists, but some drivers return them as JSON strings.
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [float(v) for v in value]
+
+
+def _array_literal(embedding: Sequence[float]) -> str:
+    return "ARRAY[" + ", ".join(repr(float(v)) for v in embedding) + "]"
+
+
+def top_products_sql(user_ids: Sequence[str]) -> str:
+    # One round-trip for all users, the top product per user is picked client-side.
+    return (
+        f"SELECT user_id, product_id, SUM(duration) AS total_duration "
+        f"FROM clickstream_events WHERE user_id IN ({_quote_list(user_ids)}) "
+        f"GROUP BY user_id, product_id ORDER BY SUM(duration) DESC LIMIT 100000"
+    )
+
+
+def products_sql(product_ids: Optional[Sequence[str]] = None) -> str:
+    where = f" WHERE ID IN ({_quote_list(product_ids)})" if product_ids else ""
+    return (
+        f"SELECT ID, Name, Description, embedding FROM NewProducts{where} LIMIT 100000"
+    )
+
+
+def similar_products_sql(embedding: Sequence[float], k: int) -> str:
+    array = _array_literal(embedding)
+    # No alias in ORDER BY, see finetuned_prompt item 8.
+    return (
+        f"SELECT ID, Name, Description, cosine_distance(embedding, {array}) AS cosine "
+        f"FROM NewProducts WHERE VECTOR_SIMILARITY(embedding, {array}, {k}) "
+        f"ORDER BY cosine_distance(embedding, {array}) ASC LIMIT {k}"
+    )
+
+
+class LocalEmbeddingIndex:
+    """
+    In-memory cosine similarity index over the NewProducts embeddings, backed by NumPy.
+    Loaded with a single query, then answers any number of queries in one matrix product.
+    Reloaded lazily once it is older than `refresh_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        db: SQLDatabase,
+        refresh_interval: float = DEFAULT_INDEX_REFRESH_INTERVAL_SECONDS,
+    ):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._products: List[Product] = []
+        self._matrix = None
+        self._loaded_at: Optional[float] = None
+
+    def load(self) -> None:
+        import numpy as np
+
+        rows = self.db.run(products_sql(), fetch="cursor").fetchall()
+        products, vectors = [], []
+        for product_id, name, description, embedding in rows:
+            products.append((product_id, name, description))
+            vectors.append(_parse_embedding(embedding))
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        with self._lock:
+            self._products = products
+            self._matrix = matrix / np.where(norms == 0, 1, norms)
+            self._loaded_at = time.time()
+
+    def _index(self) -> Tuple[List[Product], Any]:
+        if (
+            self._loaded_at is None
+            or time.time() - self._loaded_at >= self.refresh_interval
+        ):
+            try:
+                self.load()
+            except SQLAlchemyError:
+                # A stale index is better than none, retry on the next search.
+                if self._matrix is None:
+                    raise
+        with self._lock:
+            return self._products, self._matrix
+
+    def search(
+        self, embeddings: Sequence[Sequence[float]], k: int
+    ) -> List[List[Tuple[Product, float]]]:
+        """k nearest products (with cosine distance) for every query embedding, in one batch."""
+        import numpy as np
+
+        products, matrix = self._index()
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        distances = 1.0 - queries @ matrix.T
+
+        k = min(k, len(products))
+        results = []
+        for row in distances:
+            nearest = np.argpartition(row, k - 1)[:k] if k else []
+            nearest = sorted(nearest, key=lambda i: row[i])
+            results.append([(products[i], float(row[i])) for i in nearest])
+        return results
+
+
+class ProductRecommender:
+    """
+    Recommends products to users, similar to the product each user spent the most time on.
+    Embeddings stay server-side, they never pass through the LLM.
+    """
+
+    def __init__(
+        self,
+        db: SQLDatabase,
+        local_index: Optional[LocalEmbeddingIndex] = None,
+        max_workers: int = 4,
+    ):
+        self.db = db
+        self.local_index = local_index
+        self.max_workers = max_workers
+
+    def _rows(self, query: str) -> List[Tuple]:
+        return [tuple(row) for row in self.db.run(query, fetch="cursor").fetchall()]
+
+    def top_products(self, user_ids: Sequence[str]) -> Dict[str, str]:
+        """user_id -> product_id the user spent the most time on, both as strings."""
+        top = {}
+        # Rows are ordered by duration, so the first row seen per user is its top product.
+        # IDs are compared as strings, the LLM passes them as strings whatever their type.
+        for user_id, product_id, _ in self._rows(top_products_sql(user_ids)):
+            top.setdefault(str(user_id), str(product_id))
+        return top
+
+    def _similar_in_pinot(
+        self, embeddings: List[List[float]], k: int
+    ) -> List[List[Tuple[Product, float]]]:
+        def search(embedding):
+            rows = self._rows(similar_products_sql(embedding, k))
+            return [
+                ((id_, name, desc), float(cosine)) for id_, name, desc, cosine in rows
+            ]
+
+        # Pinot has no multi-vector query, so the per-user searches are issued concurrently.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(search, embeddings))
+
+    def recommend(
+        self, user_ids: Sequence[str], k: int = 3
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        str(user_id) -> {"top_product": (ID, Name, Description),
+                         "recommendations": [((ID, Name, Description), cosine_distance), ...]}
+        """
+        top = self.top_products(user_ids)
+        if not top:
+            return {}
+
+        products = {
+            str(product_id): (
+                (product_id, name, description),
+                _parse_embedding(embedding),
+            )
+            for product_id, name, description, embedding in self._rows(
+                products_sql(sorted(set(top.values())))
+            )
+        }
+        users = [
+            str(user_id) for user_id in user_ids if top.get(str(user_id)) in products
+        ]
+        embeddings = [products[top[user_id]][1] for user_id in users]
+        if not embeddings:
+            return {}
+
+        # Ask for one extra result, the top product itself is always its own nearest neighbour.
+        if self.local_index is not None:
+            neighbours = self.local_index.search(embeddings, k + 1)
+        else:
+            neighbours = self._similar_in_pinot(embeddings, k + 1)
+
+        recommendations = {}
+        for user_id, similar in zip(users, neighbours):
+            top_product = products[top[user_id]][0]
+            recommendations[user_id] = {
+                "top_product": top_product,
+                "recommendations": [
+                    (product, distance)
+                    for product, distance in similar
+                    if str(product[0]) != str(top_product[0])
+                ][:k],
+            }
+        return recommendations
+
+
+def format_recommendations(
+    user_ids: Sequence[str], recommendations: Dict[str, Dict[str, Any]]
+) -> str:
+    lines = []
+    for user_id in user_ids:
+        user = recommendations.get(str(user_id))
+        if user is None:
+            lines.append(f"User {user_id}: no activity found, nothing to recommend.")
+            continue
+        _, name, description = user["top_product"]
+        lines.append(f"User {user_id}:")
+        lines.append(f"  Top product: {name} - {description}")
+        lines.append("  Recommended products:")
+        for (_, name, description), distance in user["recommendations"]:
+            lines.append(
+                f"    - {name} - {description} (cosine distance {distance:.4f})"
+            )
+    return "\n".join(lines)
+
+
+class RecommendProductsInput(BaseModel):
+    user_ids: List[str] = Field(
+        description="IDs of the users (user_id in clickstream_events) to recommend products to."
+    )
+    k: int = Field(default=3, description="Number of products to recommend per user.")
+
+
+class RecommendProductsTool(BaseTool):
+    """Tool that recommends similar products to users, doing the whole pipeline server-side."""
+
+    name: str = "recommend_products"
+    description: str = (
+        "Input is a list of user IDs. For each user, finds the product the user spent the most "
+        "time on, and recommends the k most similar products (vector similarity search over the "
+        "product embeddings). Returns the names and descriptions of each user's top product and "
+        "of the recommended products. Use this instead of fetching embeddings yourself."
+    )
+    args_schema: Type[BaseModel] = RecommendProductsInput
+    recommender: ProductRecommender = Field(exclude=True)
+
+    def _run(self, user_ids: List[str], k: int = 3, run_manager=None) -> str:
+        try:
+            return format_recommendations(
+                user_ids, self.recommender.recommend(user_ids, k)
+            )
+        except Exception as e:
+            # Same convention as sql_db_query, so the agent can react to the error.
+            return f"Error: {e}"
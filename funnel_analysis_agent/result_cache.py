@@ -0,0 +1,296 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
+from langchain_community.utilities import SQLDatabase
+from langchain_core.tools import BaseTool
+from pydantic import Field
+from sqlalchemy.exc import SQLAlchemyError
+
+from .dimensions import DimensionStore
+from .query_results import (
+    DEFAULT_MAX_ROWS,
+    DEFAULT_PREVIEW_ROWS,
+    ColumnarResult,
+    ResultStore,
+    stream_query,
+)
+
+logger = logging.getLogger(__name__)
+
+# Max age of a cached result, per table. Fact tables are real-time, so their results go
+# stale quickly; the dimension tables hardly change.
+DEFAULT_MAX_AGE_SECONDS = {
+    "clickstream_events": 30.0,
+    "purchase_info": 60.0,
+}
+DEFAULT_DIMENSION_MAX_AGE_SECONDS = 3600.0
+
+# Rows held by all cached results together, so a few big results can't pin gigabytes.
+DEFAULT_MAX_CACHED_ROWS = 1_000_000
+
+# Columns whose max value tells us whether new rows have landed in a real-time table.
+WATERMARK_COLUMNS = {"clickstream_events": "event_timestamp"}
+
+_STRING_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+[`\"]?([\w.]+)", re.IGNORECASE)
+_LOOKUP_TABLE_RE = re.compile(r"\bLOOKUP\s*\(\s*'([\w.]+)'", re.IGNORECASE)
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace outside string literals and drop trailing semicolons."""
+    parts = _STRING_LITERAL_RE.split(query.strip().rstrip(";").strip())
+    # Odd indices are the string literals themselves, keep them untouched.
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts)
+    ).strip()
+
+
+def referenced_tables(query: str) -> Set[str]:
+    """Tables referenced by a query, including LOOKUP dimension tables (database prefix stripped)."""
+    tables = _TABLE_RE.findall(query) + _LOOKUP_TABLE_RE.findall(query)
+    return {table.split(".")[-1] for table in tables}
+
+
+def pinot_watermark_fn(db: SQLDatabase) -> Callable[[str], Optional[Any]]:
+    """Returns a function that fetches the current watermark (max event time) of a table."""
+
+    def watermark(table: str) -> Optional[Any]:
+        column = WATERMARK_COLUMNS.get(table)
+        if column is None:
+            return None
+        result = db.run_no_throw(f"SELECT MAX({column}) FROM {table}")
+        return None if result.startswith("Error") else result
+
+    return watermark
+
+
+class QueryResultCache:
+    """
+    Bounded LRU cache of query results, keyed by normalized SQL. Holds at most
+    `max_entries` results and `max_rows` rows in total (a result's `row_count`).
+
+    An entry is stale once it is older than the smallest max age of the tables it reads,
+    or once the watermark of one of those tables has moved since it was stored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_rows: int = DEFAULT_MAX_CACHED_ROWS,
+        max_age_seconds: Optional[Dict[str, float]] = None,
+        default_max_age_seconds: float = DEFAULT_DIMENSION_MAX_AGE_SECONDS,
+        watermark_fn: Optional[Callable[[str], Optional[Any]]] = None,
+        watermark_check_interval: float = 5.0,
+    ):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.max_age_seconds = (
+            DEFAULT_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+        )
+        self.default_max_age_seconds = default_max_age_seconds
+        self.watermark_fn = watermark_fn
+        self.watermark_check_interval = watermark_check_interval
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._rows = 0  # rows of all cached results
+        # table -> (watermark, checked_at), so we don't probe Pinot on every lookup
+        self._watermarks: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def _current_watermark(self, table: str) -> Optional[Any]:
+        # Called without holding self._lock, the probe is a query to Pinot.
+        if self.watermark_fn is None or table not in WATERMARK_COLUMNS:
+            return None
+        cached = self._watermarks.get(table)
+        now = time.time()
+        if cached is not None and now - cached[1] < self.watermark_check_interval:
+            return cached[0]
+        value = self.watermark_fn(table)
+        self._watermarks[table] = (value, now)
+        return value
+
+    def watermarks(self, query: str) -> Dict[str, Any]:
+        """
+        Current watermarks of the real-time tables a query reads. Take them before
+        running the query and pass them to `put`, so rows landing while it runs make the
+        entry stale instead of being missed.
+        """
+        return {
+            table: self._current_watermark(table)
+            for table in referenced_tables(normalize_sql(query))
+            if table in WATERMARK_COLUMNS
+        }
+
+    def _max_age(self, tables: Set[str]) -> float:
+        return min(
+            [
+                self.max_age_seconds.get(table, self.default_max_age_seconds)
+                for table in tables
+            ]
+            or [self.default_max_age_seconds]
+        )
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["stored_at"] >= self._max_age(entry["tables"])
+
+    def _remove(self, key: str) -> None:
+        self._rows -= self._entries.pop(key)["rows"]
+
+    def _drop_stale(self, key: str, entry: Dict[str, Any]) -> None:
+        # Another thread may have replaced the entry in the meantime, keep that one.
+        if self._entries.get(key) is entry:
+            self._remove(key)
+        self.stale += 1
+        self.misses += 1
+
+    def get(self, query: str) -> Optional[Any]:
+        key = normalize_sql(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self._is_expired(entry):
+                self._drop_stale(key, entry)
+                return None
+
+        current = {
+            table: self._current_watermark(table) for table in entry["watermarks"]
+        }
+
+        with self._lock:
+            if current != entry["watermarks"]:
+                self._drop_stale(key, entry)
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["result"]
+
+    def put(
+        self, query: str, result: Any, watermarks: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Stores a result, with the `watermarks` taken before the query ran (or now)."""
+        key = normalize_sql(query)
+        rows = getattr(result, "row_count", 1)
+        if rows > self.max_rows:
+            return
+        if watermarks is None:
+            watermarks = self.watermarks(key)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "result": result,
+                "rows": rows,
+                "stored_at": time.time(),
+                "tables": referenced_tables(key),
+                "watermarks": watermarks,
+            }
+            self._rows += rows
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, table: Optional[str] = None) -> None:
+        """Drop every entry, or only the ones that read from the given table."""
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+                self._rows = 0
+                self._watermarks.clear()
+                return
+            for key in [k for k, e in self._entries.items() if table in e["tables"]]:
+                self._remove(key)
+            self._watermarks.pop(table, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "rows": self._rows,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedQuerySQLDatabaseTool(QuerySQLDataBaseTool):
+    """
+    `sql_db_query` tool that serves repeated queries from a QueryResultCache.
+    With a DimensionStore, results are also decorated with dimension columns.
+
+    Rows are streamed into a query_results.ColumnarResult (at most `max_rows` of them).
+    The LLM gets a preview of `preview_rows` rows plus column statistics, and the tool
+    message's artifact is the id of the full result in `results`.
+    """
+
+    response_format: str = "content_and_artifact"
+    cache: QueryResultCache = Field(exclude=True)
+    results: ResultStore = Field(default_factory=ResultStore, exclude=True)
+    dimensions: Optional[DimensionStore] = Field(default=None, exclude=True)
+    max_rows: int = DEFAULT_MAX_ROWS
+    preview_rows: int = DEFAULT_PREVIEW_ROWS
+
+    def _run(self, query: str, run_manager=None) -> Tuple[str, Optional[str]]:
+        result = self.cache.get(query)
+        if result is None:
+            watermarks = self.cache.watermarks(query)
+            try:
+                result = stream_query(self.db, query, max_rows=self.max_rows)
+            except SQLAlchemyError as e:
+                # Errors are not cached, the agent is expected to fix the query and retry.
+                return f"Error: {e}", None
+            # A truncated result is partial, and as big as results get: not worth the memory.
+            if self._decorate(result) and not result.truncated:
+                self.cache.put(query, result, watermarks)
+
+        content = result.preview(self.preview_rows, self.db._max_string_length)
+        return content, self.results.put(result)
+
+    def _decorate(self, result: ColumnarResult) -> bool:
+        """Adds the dimension columns, returns False if they couldn't be loaded."""
+        if self.dimensions is None:
+            return True
+        try:
+            self.dimensions.decorate_result(result)
+        except Exception:
+            # The query itself worked, so the result is returned as is (and not cached).
+            logger.warning(
+                "Could not decorate the result with dimension columns", exc_info=True
+            )
+            return False
+        return True
+
+
+def with_result_cache(
+    tools: List[BaseTool],
+    cache: QueryResultCache,
+    dimensions: Optional[DimensionStore] = None,
+    results: Optional[ResultStore] = None,
+) -> List[BaseTool]:
+    """Replaces the toolkit's `sql_db_query` tool with its cached counterpart."""
+    return [
+        (
+            CachedQuerySQLDatabaseTool(
+                db=tool.db,
+                cache=cache,
+                dimensions=dimensions,
+                results=results if results is not None else ResultStore(),
+            )
+            if isinstance(tool, QuerySQLDataBaseTool)
+            else tool
+        )
+        for tool in tools
+    ]
@@ -0,0 +1,423 @@
+import json
+import logging
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from langchain_community.utilities import SQLDatabase
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from .dimensions import DimensionStore
+
+if TYPE_CHECKING:
+    from .funnel_view import IncrementalFunnel
+
+logger = logging.getLogger(__name__)
+
+# Steps of the clickstream funnel, in order, as they appear in the event_type column.
+FUNNEL_STEPS = ["view", "click", "save", "purchase"]
+
+# Columns the top items questions rely on. They are not part of the documented schema,
+# so FastPathRouter checks them against the actual one, and they can be overridden.
+PRODUCT_CATEGORY_COLUMN = "Category"  # of NewProducts, e.g. "Electronics"
+PURCHASE_PRODUCT_COLUMN = "product_id"  # of purchase_info
+PURCHASE_QUANTITY_COLUMN = "quantity"  # of purchase_info
+
+_NUMBER_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+}
+_NUMBER = r"(?:\d+|" + "|".join(_NUMBER_WORDS) + r")"
+
+_UNIT_MILLIS = {
+    "minute": 60 * 1000,
+    "hour": 60 * 60 * 1000,
+    "day": 24 * 60 * 60 * 1000,
+    "week": 7 * 24 * 60 * 60 * 1000,
+    "month": 30 * 24 * 60 * 60 * 1000,
+}
+_UNIT = "(?:" + "|".join(_UNIT_MILLIS) + ")"
+
+# A time window at the end of the question, e.g. "in the last 7 days", "last month",
+# "this week" or "today". Parsed on its own by _parse_window_millis.
+_WINDOW = (
+    rf"(?P<window> (?:(?:in|over|during|for) )?(?:the )?"
+    rf"(?:(?:last|past) (?:{_NUMBER} )?{_UNIT}s?|this {_UNIT}|today))?"
+)
+_WINDOW_RE = re.compile(
+    rf"(?:last|past) (?:({_NUMBER}) )?({_UNIT})s?$|this ({_UNIT})$|(today)$"
+)
+
+# The canonical questions, matched as a whole: any other qualifier (a filter, a pair of
+# steps, "yesterday", ...) makes the question fall through to the agent.
+_CONVERSION_RE = re.compile(
+    r"(?:what(?: is|'s) )?(?:the )?(?:overall )?(?:funnel )?conversion rate"
+    r"(?: (?:of|in) the funnel)?" + _WINDOW
+)
+_DROP_OFF_RE = re.compile(
+    r"(?:(?:what|where)(?: is|'s) )?(?:the )?"
+    r"(?:biggest|largest|highest|maximum) drop[ -]?off"
+    r"(?: (?:of|in) the funnel)?" + _WINDOW
+)
+_TOP_USERS_RE = re.compile(
+    rf"(?:(?:who|which) are )?(?:the )?top (?P<n>{_NUMBER}) users"
+    r" (?:in terms of|by|with the most)(?: total)? (?:time spent|time|duration)"
+    + _WINDOW
+)
+_TOP_ITEMS_RE = re.compile(
+    rf"(?:(?:what|which) are )?(?:the )?top (?P<n>{_NUMBER}) "
+    r"(?:(?P<category>[a-z&]+(?: [a-z&]+){0,2}) )?(?:items|products) "
+    r"(?:sold|purchased|bought)" + _WINDOW
+)
+# Words between "top N" and "items" that rank the items, rather than name a category.
+_RANKING_WORDS = {"best", "selling", "best-selling", "most", "popular"}
+
+
+@dataclass
+class Route:
+    # "conversion_rate", "drop_off", "top_users_by_time" or "top_items_sold"
+    intent: str
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+def _to_int(number: Optional[str], default: int = 1) -> int:
+    if number is None:
+        return default
+    return int(number) if number.isdigit() else _NUMBER_WORDS[number]
+
+
+def _start_of(unit: str, now: datetime) -> datetime:
+    """Start of the current minute, hour, day, week (Monday) or month, in UTC."""
+    if unit == "minute":
+        return now.replace(second=0, microsecond=0)
+    if unit == "hour":
+        return now.replace(minute=0, second=0, microsecond=0)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "week":
+        return day - timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _parse_window_millis(window: Optional[str]) -> Optional[int]:
+    """Start of the time window matched by _WINDOW, as milliseconds from epoch."""
+    if not window:
+        return None
+    match = _WINDOW_RE.search(window)
+    now = datetime.now(timezone.utc)
+    number, unit, this_unit, today = match.groups()
+    if today or this_unit:
+        return int(_start_of(this_unit or "day", now).timestamp() * 1000)
+    return int(now.timestamp() * 1000) - _to_int(number) * _UNIT_MILLIS[unit]
+
+
+def match_question(question: str) -> Optional[Route]:
+    """Detects one of the canonical funnel questions and its parameters, or returns None."""
+    q = " ".join(question.lower().split()).rstrip("?!. ")
+
+    match = _CONVERSION_RE.fullmatch(q)
+    if match:
+        return Route(
+            "conversion_rate", {"since": _parse_window_millis(match["window"])}
+        )
+    match = _DROP_OFF_RE.fullmatch(q)
+    if match:
+        return Route("drop_off", {"since": _parse_window_millis(match["window"])})
+
+    match = _TOP_USERS_RE.fullmatch(q)
+    if match:
+        return Route(
+            "top_users_by_time",
+            {
+                "n": _to_int(match["n"]),
+                "since": _parse_window_millis(match["window"]),
+            },
+        )
+
+    match = _TOP_ITEMS_RE.fullmatch(q)
+    # The timestamp column of purchase_info is not known, so a time window goes to the agent.
+    if match and not match["window"]:
+        category = match["category"]
+        if category and set(category.split()) <= _RANKING_WORDS:
+            category = None
+        elif category and category.endswith("s"):
+            category = category[:-1]
+        return Route("top_items_sold", {"n": _to_int(match["n"]), "category": category})
+
+    return None
+
+
+def _since_filter(since: Optional[int]) -> str:
+    return f" WHERE event_timestamp >= {since}" if since is not None else ""
+
+
+def _quote_list(values: List[Any]) -> str:
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+
+def funnel_count_sql(since: Optional[int] = None) -> str:
+    steps = ", ".join(f"event_type = '{step}'" for step in FUNNEL_STEPS)
+    return (
+        f"SELECT FUNNEL_COUNT(STEPS({steps}), CORRELATE_BY(user_id)) AS counts "
+        f"FROM clickstream_events{_since_filter(since)}"
+    )
+
+
+def top_users_by_time_sql(n: int, since: Optional[int] = None) -> str:
+    return (
+        f"SELECT user_id, SUM(duration) AS total_duration FROM clickstream_events"
+        f"{_since_filter(since)} GROUP BY user_id ORDER BY SUM(duration) DESC LIMIT {n}"
+    )
+
+
+def top_items_sold_sql(
+    n: int,
+    product_ids: Optional[List[str]] = None,
+    product_column: str = PURCHASE_PRODUCT_COLUMN,
+    quantity_column: str = PURCHASE_QUANTITY_COLUMN,
+) -> str:
+    where = (
+        f" WHERE {product_column} IN ({_quote_list(product_ids)})"
+        if product_ids
+        else ""
+    )
+    return (
+        f"SELECT {product_column}, SUM({quantity_column}) AS total_quantity "
+        f"FROM purchase_info{where} GROUP BY {product_column} "
+        f"ORDER BY SUM({quantity_column}) DESC LIMIT {n}"
+    )
+
+
+def names_sql(table: str, ids: List[Any]) -> str:
+    return f"SELECT ID, Name FROM {table} WHERE ID IN ({_quote_list(ids)})"
+
+
+def category_products_sql(
+    category: str, category_column: str = PRODUCT_CATEGORY_COLUMN
+) -> str:
+    category = category.lower().replace("'", "''")
+    return (
+        f"SELECT ID, Name FROM NewProducts "
+        f"WHERE LOWER({category_column}) LIKE '%{category}%' LIMIT 100000"
+    )
+
+
+def parse_counts(value: Any) -> List[int]:
+    """The users per step of a FUNNEL_COUNT result value."""
+    # FUNNEL_COUNT returns an array, which some drivers hand back as a JSON string.
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [int(v) for v in value]
+
+
+class _Transcript:
+    """
+    Messages of a fast path answer, as the agent would have streamed them: every query is
+    shown as a tool call of the agent, so the answer renders the same way.
+    """
+
+    def __init__(self, db: SQLDatabase, question: str):
+        self.db = db
+        self.messages = [HumanMessage(question)]
+        self.events = [{"messages": list(self.messages)}]
+
+    def _append(self, message) -> None:
+        self.messages.append(message)
+        self.events.append({"messages": list(self.messages)})
+
+    def record(self, tool: str, args: Dict[str, Any], content: str) -> None:
+        call_id = f"fastpath_{uuid.uuid4().hex[:12]}"
+        self._append(
+            AIMessage("", tool_calls=[{"name": tool, "args": args, "id": call_id}])
+        )
+        self._append(ToolMessage(content, name=tool, tool_call_id=call_id))
+
+    def run(self, query: str) -> List[Tuple]:
+        rows = [tuple(row) for row in self.db.run(query, fetch="cursor").fetchall()]
+        self.record("sql_db_query", {"query": query}, str(rows))
+        return rows
+
+    def answer(self, text: str) -> List[Dict[str, Any]]:
+        self._append(AIMessage(text))
+        return self.events
+
+
+class FastPathRouter:
+    """
+    Answers the canonical funnel questions with pre-built, parameterized Pinot SQL,
+    without going through the LLM. Unrecognized questions return None from `answer`,
+    and should fall back to the agent.
+
+    Answers are returned as the same "values" events the agent streams, so they can be
+    rendered with print_results.
+    """
+
+    def __init__(
+        self,
+        db: SQLDatabase,
+        dimensions: Optional[DimensionStore] = None,
+        funnel: Optional["IncrementalFunnel"] = None,
+        category_column: str = PRODUCT_CATEGORY_COLUMN,
+        purchase_product_column: str = PURCHASE_PRODUCT_COLUMN,
+        purchase_quantity_column: str = PURCHASE_QUANTITY_COLUMN,
+    ):
+        self.db = db
+        self.dimensions = dimensions
+        # Funnel questions over all events are answered from this view, without a query.
+        self.funnel = funnel
+        self.category_column = category_column
+        self.purchase_product_column = purchase_product_column
+        self.purchase_quantity_column = purchase_quantity_column
+
+    def _has_columns(self, table: str, columns: List[str]) -> bool:
+        """Whether the table has the columns, when the schema is known (CachedSQLDatabase)."""
+        get_table_columns = getattr(self.db, "get_table_columns", None)
+        if get_table_columns is None:
+            return True
+        known = {column.lower() for column in get_table_columns().get(table, [])}
+        missing = [column for column in columns if column.lower() not in known]
+        if missing:
+            logger.warning(
+                "%s has no column %s, top items questions go to the agent",
+                table,
+                ", ".join(missing),
+            )
+        return not missing
+
+    def _names(
+        self, transcript: _Transcript, table: str, ids: List[Any]
+    ) -> Dict[Any, str]:
+        if self.dimensions is not None:
+            return self.dimensions.lookup(table, "Name", ids)
+        # LOOKUP can't be combined with GROUP BY, so names are fetched separately.
+        # IDs are matched as strings, like DimensionStore does.
+        names = {str(id_): name for id_, name in transcript.run(names_sql(table, ids))}
+        return {id_: names[str(id_)] for id_ in ids if str(id_) in names}
+
+    def answer(self, question: str) -> Optional[List[Dict[str, Any]]]:
+        route = match_question(question)
+        if route is None:
+            return None
+
+        transcript = _Transcript(self.db, question)
+        try:
+            text = getattr(self, f"_answer_{route.intent}")(transcript, **route.params)
+        except Exception:
+            # Anything unexpected (schema drift, driver quirks) is left to the agent.
+            logger.warning(
+                "Fast path %s failed, falling back to the agent",
+                route.intent,
+                exc_info=True,
+            )
+            return None
+        if text is None:
+            return None
+        return transcript.answer(text)
+
+    def _funnel_counts(
+        self, transcript: _Transcript, since: Optional[int]
+    ) -> List[int]:
+        if self.funnel is not None and since is None:
+            counts = self.funnel.counts()
+            transcript.record("funnel_counts", {}, self.funnel.describe(counts))
+            return counts
+        rows = transcript.run(funnel_count_sql(since))
+        return parse_counts(rows[0][0])
+
+    def _answer_conversion_rate(
+        self, transcript: _Transcript, since: Optional[int] = None
+    ) -> Optional[str]:
+        counts = self._funnel_counts(transcript, since)
+        if not counts or counts[0] == 0:
+            return (
+                "No users entered the funnel, so there is no conversion rate to report."
+            )
+        steps = ", ".join(
+            f"{step}: {count}" for step, count in zip(FUNNEL_STEPS, counts)
+        )
+        rate = counts[-1] / counts[0] * 100
+        return (
+            f"The overall funnel conversion rate is {rate:.2f}% "
+            f"({counts[-1]} of {counts[0]} users who entered the funnel made a purchase).\n\n"
+            f"Users per funnel step: {steps}."
+        )
+
+    def _answer_drop_off(
+        self, transcript: _Transcript, since: Optional[int] = None
+    ) -> Optional[str]:
+        counts = self._funnel_counts(transcript, since)
+        drops = [counts[i] - counts[i + 1] for i in range(len(counts) - 1)]
+        if not drops or max(drops) <= 0:
+            return "There is no drop-off in the funnel, every user who entered it reached the final step."
+        i = drops.index(max(drops))
+        return (
+            f"The biggest drop-off is {drops[i]} users, after event_type = {FUNNEL_STEPS[i]} "
+            f"({counts[i]} users at '{FUNNEL_STEPS[i]}', "
+            f"{counts[i + 1]} at '{FUNNEL_STEPS[i + 1]}')."
+        )
+
+    def _answer_top_users_by_time(
+        self, transcript: _Transcript, n: int, since: Optional[int] = None
+    ) -> Optional[str]:
+        rows = transcript.run(top_users_by_time_sql(n, since))
+        if not rows:
+            return "No user activity was found."
+        names = self._names(transcript, "Users", [user_id for user_id, _ in rows])
+        lines = [
+            f"{i}. {names.get(user_id, user_id)} ({duration:,.0f} ms)"
+            for i, (user_id, duration) in enumerate(rows, 1)
+        ]
+        return f"The top {n} users in terms of time spent are:\n\n" + "\n".join(lines)
+
+    def _answer_top_items_sold(
+        self, transcript: _Transcript, n: int, category: Optional[str] = None
+    ) -> Optional[str]:
+        if not self._has_columns(
+            "purchase_info",
+            [self.purchase_product_column, self.purchase_quantity_column],
+        ):
+            return None
+        names = {}
+        product_ids = None
+        if category:
+            if not self._has_columns("NewProducts", [self.category_column]):
+                return None
+            names = dict(
+                transcript.run(category_products_sql(category, self.category_column))
+            )
+            if not names:
+                # Unknown category, let the agent figure out what was meant.
+                return None
+            product_ids = list(names)
+
+        rows = transcript.run(
+            top_items_sold_sql(
+                n,
+                product_ids,
+                self.purchase_product_column,
+                self.purchase_quantity_column,
+            )
+        )
+        if not rows:
+            return "No sales were found."
+        missing = [product_id for product_id, _ in rows if product_id not in names]
+        if missing:
+            names.update(self._names(transcript, "NewProducts", missing))
+
+        lines = [
+            f"{i}. {names.get(product_id, product_id)} ({quantity:,.0f} sold)"
+            for i, (product_id, quantity) in enumerate(rows, 1)
+        ]
+        label = f"{category} items" if category else "items"
+        return f"The top {n} {label} sold are:\n\n" + "\n".join(lines)
@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import inspect
+
+from .finetuned_prompt import cached_schema_prompt
+
+# Schema of the funnel tables hardly ever changes, so an hour is a safe default.
+DEFAULT_TTL_SECONDS = 3600.0
+
+
+class MetadataCache:
+    """Small thread-safe key/value cache with a TTL and an optional JSON snapshot on disk."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        snapshot_path: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.snapshot_path = snapshot_path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["stored_at"] < self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not self._is_fresh(entry):
+                del self._entries[key]
+                return None
+            return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = {"value": value, "stored_at": time.time()}
+        if self.snapshot_path:
+            self.save_snapshot(self.snapshot_path)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one key, or everything when no key is given (including the snapshot)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        if self.snapshot_path:
+            self.save_snapshot(self.snapshot_path)
+
+    def save_snapshot(self, path: str) -> None:
+        with self._lock:
+            data = dict(self._entries)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        # Atomic replace so a concurrent reader never sees a half-written file.
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path: str) -> None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # A corrupt or unreadable snapshot is just a cold cache.
+            return
+
+        with self._lock:
+            for key, entry in data.items():
+                if isinstance(entry, dict) and self._is_fresh(entry):
+                    self._entries[key] = entry
+
+
+class _CachedInspector:
+    """
+    Wraps the Inspector SQLDatabase.__init__ lists the tables with, so a fresh cache
+    (e.g. a snapshot from the last run) answers instead of the database.
+    """
+
+    def __init__(self, inspector, metadata_cache: MetadataCache):
+        self._inspector = inspector
+        self._metadata_cache = metadata_cache
+
+    def get_table_names(self, schema: Optional[str] = None) -> List[str]:
+        table_names = self._metadata_cache.get("all_tables")
+        if table_names is None:
+            table_names = self._inspector.get_table_names(schema=schema)
+            self._metadata_cache.set("all_tables", table_names)
+        return table_names
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inspector, name)
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase that caches table names and table info (schema + sample rows).
+
+    The SQLDatabaseToolkit tools `sql_db_list_tables` and `sql_db_schema` go through
+    `get_usable_table_names` and `get_table_info`, so they transparently hit the cache.
+    Once the cache is invalidated or expires, the tables are listed and reflected again.
+    """
+
+    def __init__(
+        self,
+        *args,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        snapshot_path: Optional[str] = None,
+        **kwargs,
+    ):
+        # SQLDatabase.__init__ already lists the tables, so the cache must exist first.
+        self.metadata_cache = MetadataCache(ttl_seconds, snapshot_path)
+        # Guards the table lists and reflected metadata of SQLDatabase while they are redone.
+        self._schema_lock = threading.RLock()
+        self._initialized = False
+        # Tables are reflected when get_table_info first needs them, not all at startup.
+        kwargs.setdefault("lazy_table_reflection", True)
+        super().__init__(*args, **kwargs)
+        self._initialized = True
+
+    @property
+    def _inspector(self):
+        return self._cached_inspector
+
+    @_inspector.setter
+    def _inspector(self, inspector) -> None:
+        # Set by SQLDatabase.__init__, right before it lists all tables.
+        self._cached_inspector = _CachedInspector(inspector, self.metadata_cache)
+
+    def _list_tables(self) -> None:
+        # SQLDatabase.__init__ lists the tables only once. A new Inspector is needed too,
+        # the one it kept memoizes its answers.
+        inspector = inspect(self._engine)
+        table_names = inspector.get_table_names(schema=self._schema)
+        if self._view_support:
+            table_names += inspector.get_view_names(schema=self._schema)
+        self.metadata_cache.set("all_tables", table_names)
+        self._all_tables = set(table_names)
+        usable_tables = super().get_usable_table_names()
+        self._usable_tables = set(usable_tables) if usable_tables else self._all_tables
+
+    def get_usable_table_names(self) -> Iterable[str]:
+        table_names = self.metadata_cache.get("tables")
+        if table_names is None:
+            with self._schema_lock:
+                # Right after __init__ listed them, the tables are already current.
+                if self._initialized:
+                    self._list_tables()
+                table_names = list(super().get_usable_table_names())
+            self.metadata_cache.set("tables", table_names)
+        return table_names
+
+    def get_table_info(self, table_names: Optional[List[str]] = None) -> str:
+        key = "table_info:" + ",".join(sorted(table_names or []))
+        table_info = self.metadata_cache.get(key)
+        if table_info is None:
+            with self._schema_lock:
+                # SQLDatabase only reflects tables it hasn't yet, drop them to see new columns.
+                self._metadata.clear()
+                table_info = super().get_table_info(table_names)
+            self.metadata_cache.set(key, table_info)
+        return table_info
+
+    def get_table_columns(self) -> Dict[str, List[str]]:
+        """table -> column names, for all usable tables."""
+        columns = self.metadata_cache.get("columns")
+        if columns is None:
+            inspector = inspect(self._engine)
+            columns = {
+                table: [
+                    column["name"]
+                    for column in inspector.get_columns(table, schema=self._schema)
+                ]
+                for table in self.get_usable_table_names()
+            }
+            self.metadata_cache.set("columns", columns)
+        return columns
+
+    def invalidate_metadata(self) -> None:
+        self.metadata_cache.invalidate()
+
+    def schema_prompt(self) -> str:
+        """Cached schema of all usable tables, formatted to be appended to the system message."""
+        return cached_schema_prompt.format(
+            table_names=", ".join(self.get_usable_table_names()),
+            table_info=self.get_table_info(),
+        )
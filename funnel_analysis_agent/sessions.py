@@ -0,0 +1,221 @@
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from .tracing import optional_span
+
+# Budget of the conversation history sent to the LLM, on top of the system message.
+DEFAULT_HISTORY_TOKEN_BUDGET = 8000
+
+# Characters of an old query result kept once it gets compacted, enough for a few rows.
+COMPACTED_RESULT_CHARS = 600
+
+# Tool outputs that only matter while answering their own question.
+_TRANSIENT_TOOLS = {"sql_db_query_checker", "sql_db_list_tables", "sql_db_schema"}
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    chars = len(str(message.content))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        chars += len(str(tool_call["args"]))
+    return chars // 4
+
+
+def count_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Rough OpenAI tokenizer estimate (~4 characters per token), tool call arguments included."""
+    # Summed per message, so it matches the running total of compact_messages exactly.
+    return sum(_message_tokens(message) for message in messages)
+
+
+def _last_turn_start(messages: Sequence[BaseMessage]) -> int:
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].type == "human":
+            return i
+    return 0
+
+
+def _with_content(message: ToolMessage, content: str) -> ToolMessage:
+    # Same id and tool_call_id, so the update replaces the message in the checkpoint.
+    return message.model_copy(update={"content": content})
+
+
+def _evict_transient(message: ToolMessage) -> ToolMessage:
+    if message.name not in _TRANSIENT_TOOLS:
+        return message
+    return _with_content(message, f"[{message.name} output removed]")
+
+
+def _truncate_result(message: ToolMessage) -> ToolMessage:
+    content = str(message.content)
+    if len(content) <= COMPACTED_RESULT_CHARS or content.endswith("in total]"):
+        return message
+    return _with_content(
+        message,
+        content[:COMPACTED_RESULT_CHARS]
+        + f"... [truncated, {len(content)} characters in total]",
+    )
+
+
+def _evict_result(message: ToolMessage) -> ToolMessage:
+    if str(message.content).endswith("removed]"):
+        return message
+    return _with_content(message, f"[{message.name} output removed]")
+
+
+def compact_messages(
+    messages: Sequence[BaseMessage], token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET
+) -> List[BaseMessage]:
+    """
+    Shrinks the conversation history to `token_budget`, cheapest information first:
+
+    1. outputs of the query checker, list tables and schema tools of earlier questions
+       (the schema is in the system message anyway) are evicted,
+    2. earlier query results and recommendations are cut down to their first rows,
+    3. earlier results are evicted, leaving only the questions, queries and answers,
+    4. the oldest questions are dropped as a whole.
+
+    The messages of the current question are never touched, and tool calls always keep
+    their tool message, so the result is a valid history for the LLM.
+    """
+    messages = list(messages)
+    tokens = [_message_tokens(message) for message in messages]
+    total = sum(tokens)
+    if total <= token_budget:
+        return messages
+
+    # Running total, so compacting stays linear in the length of the history.
+    current = _last_turn_start(messages)
+    for compact in (_evict_transient, _truncate_result, _evict_result):
+        for i in range(current):
+            if total <= token_budget:
+                return messages
+            if isinstance(messages[i], ToolMessage):
+                compacted = compact(messages[i])
+                if compacted is not messages[i]:
+                    messages[i] = compacted
+                    new_tokens = _message_tokens(compacted)
+                    total += new_tokens - tokens[i]
+                    tokens[i] = new_tokens
+
+    # Drop whole questions, oldest first.
+    start = 0
+    while start < current and total > token_budget:
+        end = next(
+            (
+                i
+                for i in range(start + 1, current)
+                if isinstance(messages[i], HumanMessage)
+            ),
+            current,
+        )
+        total -= sum(tokens[start:end])
+        start = end
+    return messages[start:]
+
+
+def compacting_state_modifier(
+    system_message: Union[str, Callable[[], str]],
+    token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+):
+    """
+    create_react_agent state_modifier, that keeps the history within `token_budget`.
+    `system_message` can be a function, called before every LLM call.
+    """
+
+    def state_modifier(state: Dict[str, Any]) -> List[BaseMessage]:
+        content = system_message() if callable(system_message) else system_message
+        return [SystemMessage(content=content)] + compact_messages(
+            state["messages"], token_budget
+        )
+
+    return state_modifier
+
+
+class Session:
+    """
+    A conversation with the agent, whose history is kept by the agent's langgraph
+    checkpointer under `thread_id`, so follow-up questions can reuse earlier results
+    (e.g. "recommend products to these top users").
+
+    After every question the stored history is compacted to `token_budget`, so prompt
+    size, latency and memory stay bounded over long sessions. Questions answered by the
+    router are added to the history as well.
+    """
+
+    def __init__(
+        self,
+        agent,
+        router=None,
+        thread_id: Optional[str] = None,
+        token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+    ):
+        if agent.checkpointer is None:
+            raise ValueError("Sessions need an agent built with a checkpointer.")
+        self.agent = agent
+        self.router = router
+        self.thread_id = thread_id or str(uuid.uuid4())
+        self.token_budget = token_budget
+
+    def _config(self, callbacks=None) -> Dict[str, Any]:
+        config = {"configurable": {"thread_id": self.thread_id}}
+        if callbacks:
+            config["callbacks"] = callbacks
+        return config
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return list(self.agent.get_state(self._config()).values.get("messages", []))
+
+    def _fast_path(self, question: str, tracer=None) -> Optional[List[Dict[str, Any]]]:
+        if self.router is None:
+            return None
+        with optional_span(tracer, "fast_path", "router"):
+            events = self.router.answer(question)
+        if events is not None:
+            # Recorded as if the agent had answered, so follow-ups can build on it.
+            self.agent.update_state(
+                self._config(), {"messages": events[-1]["messages"]}, as_node="agent"
+            )
+        return events
+
+    def compact(self) -> None:
+        """Compacts the stored history to the token budget."""
+        messages = self.messages
+        compacted = {
+            message.id: message
+            for message in compact_messages(messages, self.token_budget)
+        }
+        # Dropped messages are removed, compacted ones replaced (they keep their id).
+        updates = [
+            (
+                RemoveMessage(id=message.id)
+                if message.id not in compacted
+                else compacted[message.id]
+            )
+            for message in messages
+            if compacted.get(message.id) is not message
+        ]
+        if updates:
+            self.agent.update_state(
+                self._config(), {"messages": updates}, as_node="agent"
+            )
+
+    def stream(self, question: str, tracer=None) -> Iterator[Dict[str, Any]]:
+        """Like agent.stream(..., stream_mode="values"), within this session."""
+        events = self._fast_path(question, tracer)
+        if events is not None:
+            yield from events
+        else:
+            yield from self.agent.stream(
+                {"messages": [("user", question)]},
+                config=self._config([tracer] if tracer is not None else None),
+                stream_mode="values",
+            )
+        self.compact()
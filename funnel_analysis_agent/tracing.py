@@ -0,0 +1,241 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+@dataclass
+class Span:
+    kind: str  # "llm", "tool" or "fast_path"
+    name: str  # model name, tool name (e.g. "sql_db_query") or "router"
+    start: float  # seconds since epoch
+    duration_ms: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    result_size: int = 0  # characters of tool output / generated text
+    error: Optional[str] = None
+
+
+def _result_size(output: Any) -> int:
+    # Tools return either a string or a ToolMessage wrapping it.
+    return len(str(getattr(output, "content", output)))
+
+
+class RunTracer(BaseCallbackHandler):
+    """
+    Records a span per LLM turn and per tool call of one agent run.
+
+    Pass it as a callback, e.g. `agent.stream(inputs, config={"callbacks": [tracer]})`,
+    then `summary()` gives the latency breakdown and token counts of the run.
+    """
+
+    def __init__(self, question: str):
+        self.question = question
+        self.spans: List[Span] = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+        self._open: Dict[UUID, tuple] = {}  # run_id -> (kind, name, start, perf start)
+        self._lock = threading.Lock()
+
+    def _open_span(self, run_id: UUID, kind: str, name: str) -> None:
+        with self._lock:
+            self._open[run_id] = (kind, name, time.time(), time.perf_counter())
+
+    def _close_span(self, run_id: UUID, **fields) -> None:
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+            if opened is None:
+                return
+            kind, name, start, perf_start = opened
+            duration_ms = (time.perf_counter() - perf_start) * 1000
+            self.spans.append(Span(kind, name, start, duration_ms, **fields))
+
+    @contextmanager
+    def span(self, kind: str, name: str):
+        """Records a span around code that doesn't go through LangChain callbacks."""
+        start, perf_start = time.time(), time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - perf_start) * 1000
+            with self._lock:
+                self.spans.append(Span(kind, name, start, duration_ms, error=error))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        name = (kwargs.get("invocation_params") or {}).get("model_name") or (
+            serialized or {}
+        ).get("name", "llm")
+        self._open_span(run_id, "llm", name)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._open_span(run_id, "llm", (serialized or {}).get("name", "llm"))
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs) -> None:
+        input_tokens = output_tokens = result_size = 0
+        for generations in response.generations:
+            for generation in generations:
+                result_size += len(generation.text)
+                usage = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+
+        if not (input_tokens or output_tokens):
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens = token_usage.get("prompt_tokens", 0)
+            output_tokens = token_usage.get("completion_tokens", 0)
+
+        self._close_span(
+            run_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            result_size=result_size,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs) -> None:
+        self._close_span(run_id, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        self._open_span(run_id, "tool", (serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output: Any, *, run_id, **kwargs) -> None:
+        self._close_span(run_id, result_size=_result_size(output))
+
+    def on_tool_error(self, error: BaseException, *, run_id, **kwargs) -> None:
+        self._close_span(run_id, error=str(error))
+
+    def finish(self) -> None:
+        if self._end is None:
+            self._end = time.perf_counter()
+
+    def summary(self, status: str = "ok") -> Dict[str, Any]:
+        """Totals of the run, as written to the JSON lines trace file."""
+        self.finish()
+        with self._lock:
+            spans = list(self.spans)
+
+        by_stage: Dict[str, float] = {}
+        for span in spans:
+            stage = span.name if span.kind == "tool" else span.kind
+            by_stage[stage] = by_stage.get(stage, 0.0) + span.duration_ms
+
+        return {
+            "question": self.question,
+            "started_at": self.started_at,
+            "status": status,
+            "total_ms": (self._end - self._start) * 1000,
+            "llm_calls": sum(span.kind == "llm" for span in spans),
+            "tool_calls": sum(span.kind == "tool" for span in spans),
+            "input_tokens": sum(span.input_tokens for span in spans),
+            "output_tokens": sum(span.output_tokens for span in spans),
+            "stage_ms": by_stage,
+            "spans": [asdict(span) for span in spans],
+        }
+
+
+def optional_span(tracer: Optional[RunTracer], kind: str, name: str):
+    """`tracer.span(kind, name)`, or a no-op context when tracing is off."""
+    return tracer.span(kind, name) if tracer is not None else nullcontext()
+
+
+def _quantile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    # nearest-rank method
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class TraceSink:
+    """
+    Collects run summaries, appends each to a JSON lines file, and can dump
+    Prometheus-style text metrics (p50/p90/p99 latency, per-stage time, tokens).
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self.summaries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, summary: Dict[str, Any]) -> None:
+        with self._lock:
+            self.summaries.append(summary)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(summary) + "\n")
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            summaries = list(self.summaries)
+
+        durations = [s["total_ms"] / 1000 for s in summaries]
+        lines = [
+            "# HELP funnel_agent_question_duration_seconds End-to-end time to answer a question.",
+            "# TYPE funnel_agent_question_duration_seconds summary",
+        ]
+        for q in (0.5, 0.9, 0.99):
+            lines.append(
+                f'funnel_agent_question_duration_seconds{{quantile="{q}"}} '
+                f"{_quantile(durations, q):.6f}"
+            )
+        lines += [
+            f"funnel_agent_question_duration_seconds_sum {sum(durations):.6f}",
+            f"funnel_agent_question_duration_seconds_count {len(durations)}",
+        ]
+
+        stages: Dict[str, float] = {}
+        for summary in summaries:
+            for stage, ms in summary["stage_ms"].items():
+                stages[stage] = stages.get(stage, 0.0) + ms / 1000
+        lines += [
+            "# HELP funnel_agent_stage_seconds_total Time spent per stage (LLM or tool name).",
+            "# TYPE funnel_agent_stage_seconds_total counter",
+        ] + [
+            f'funnel_agent_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+            for stage, seconds in sorted(stages.items())
+        ]
+
+        lines += [
+            "# HELP funnel_agent_tokens_total LLM tokens used.",
+            "# TYPE funnel_agent_tokens_total counter",
+            f'funnel_agent_tokens_total{{type="input"}} '
+            f'{sum(s["input_tokens"] for s in summaries)}',
+            f'funnel_agent_tokens_total{{type="output"}} '
+            f'{sum(s["output_tokens"] for s in summaries)}',
+            "# HELP funnel_agent_calls_total LLM and tool calls.",
+            "# TYPE funnel_agent_calls_total counter",
+            f'funnel_agent_calls_total{{kind="llm"}} '
+            f'{sum(s["llm_calls"] for s in summaries)}',
+            f'funnel_agent_calls_total{{kind="tool"}} '
+            f'{sum(s["tool_calls"] for s in summaries)}',
+            "# HELP funnel_agent_questions_total Questions answered, by status.",
+            "# TYPE funnel_agent_questions_total counter",
+        ]
+        statuses: Dict[str, int] = {}
+        for summary in summaries:
+            # "error: <message>" -> "error", to keep the label cardinality low
+            status = summary["status"].split(":")[0]
+            statuses[status] = statuses.get(status, 0) + 1
+        lines += [
+            f'funnel_agent_questions_total{{status="{status}"}} {count}'
+            for status, count in sorted(statuses.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
@@ -0,0 +1,11 @@
+import pytest
+
+from funnel_analysis_agent.benchmark.local_db import create_local_pinot
+
+
+@pytest.fixture(scope="session")
+def local_pinot():
+    # Small, so the whole suite stays fast; the data is the same on every run.
+    local = create_local_pinot(scale=2_000)
+    yield local
+    local.close()
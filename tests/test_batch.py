@@ -0,0 +1,94 @@
+import asyncio
+import io
+
+import pytest
+from langchain_core.messages import AIMessage
+from rich.console import Console
+
+from funnel_analysis_agent.batch import run_batch
+from funnel_analysis_agent.main import parse_args
+
+
+class SleepyAgent:
+    """Answers "<seconds>" questions after sleeping that long, and tracks concurrency."""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def astream(self, inputs, config=None, stream_mode="values"):
+        question = inputs["messages"][0][1]
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(float(question))
+            yield {"messages": [AIMessage(f"answer to {question}")]}
+        finally:
+            self.running -= 1
+
+
+def render(events, console):
+    for event in events:
+        console.print(event["messages"][-1].content)
+
+
+def batch(questions, **kwargs):
+    agent, output = SleepyAgent(), io.StringIO()
+    results = asyncio.run(
+        run_batch(agent, questions, render, Console(file=output), **kwargs)
+    )
+    return agent, results, output.getvalue()
+
+
+def test_results_keep_question_order_output_follows_completion():
+    agent, results, output = batch(["0.2", "0.0", "0.1"], concurrency=3)
+
+    assert [r.question for r in results] == ["0.2", "0.0", "0.1"]
+    assert [r.answer for r in results] == [
+        "answer to 0.2",
+        "answer to 0.0",
+        "answer to 0.1",
+    ]
+    assert all(r.status == "ok" for r in results)
+    # Each question is written in one piece, as soon as it completes.
+    finished = [output.index(f"Question #{i} took") for i in (2, 3, 1)]
+    assert finished == sorted(finished)
+    assert agent.max_running == 3
+
+
+def test_concurrency_limit():
+    agent, results, _ = batch(["0.05"] * 6, concurrency=2)
+    assert agent.max_running == 2
+    assert [r.index for r in results] == list(range(1, 7))
+
+
+def test_timeout_only_fails_the_slow_question():
+    _, results, output = batch(["5", "0.0"], timeout=0.1)
+
+    assert [r.status for r in results] == ["timeout", "ok"]
+    assert results[0].elapsed_seconds < 1
+    assert "Question #1 did not complete (timeout)" in output
+
+
+def test_fast_path_skips_the_agent():
+    class Router:
+        def answer(self, question):
+            return [{"messages": [AIMessage("routed")]}] if question == "5" else None
+
+    agent, results, _ = batch(["5", "0.0"], router=Router())
+    assert [r.answer for r in results] == ["routed", "answer to 0.0"]
+    assert agent.max_running == 1
+
+
+@pytest.mark.parametrize("kwargs", [{"concurrency": 0}, {"timeout": 0}])
+def test_invalid_settings_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        batch(["0.0"], **kwargs)
+
+
+@pytest.mark.parametrize(
+    "argv", [["--concurrency", "0"], ["--timeout", "0"], ["--timeout", "-1"]]
+)
+def test_invalid_arguments_are_rejected(argv):
+    with pytest.raises(SystemExit):
+        parse_args(["--batch"] + argv)
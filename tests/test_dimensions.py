@@ -0,0 +1,48 @@
+import pytest
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine, text
+
+from funnel_analysis_agent.dimensions import DimensionStore
+from funnel_analysis_agent.query_results import ColumnarResult
+from funnel_analysis_agent.router import FastPathRouter, _Transcript
+
+
+@pytest.fixture
+def int_keyed_db(tmp_path):
+    # Dimension keys stored as INT, while the fact tables hold them as STRING.
+    engine = create_engine(f"sqlite:///{tmp_path / 'dimensions.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE Users (ID INTEGER, Name TEXT)"))
+        connection.execute(
+            text("INSERT INTO Users VALUES (1, 'Ava Lee'), (2, 'Mia Kim')")
+        )
+        connection.execute(
+            text("CREATE TABLE NewProducts (ID INTEGER, Name TEXT, Description TEXT)")
+        )
+    return SQLDatabase(engine)
+
+
+def test_results_are_decorated_whatever_the_key_type(int_keyed_db):
+    result = ColumnarResult("", ["user_id", "duration"])
+    result.append_rows([("2", 10), ("1", 5), (None, 1), ("3", 1)])
+
+    DimensionStore(int_keyed_db).decorate_result(result)
+
+    assert result.column("user_name") == ["Mia Kim", "Ava Lee", None, None]
+
+
+def test_lookup_is_keyed_by_the_given_keys(int_keyed_db):
+    store = DimensionStore(int_keyed_db)
+
+    assert store.lookup("Users", "Name", ["1", 2, "3"]) == {
+        "1": "Ava Lee",
+        2: "Mia Kim",
+    }
+
+
+def test_router_names_match_ids_as_strings(int_keyed_db):
+    router = FastPathRouter(int_keyed_db)
+
+    names = router._names(_Transcript(int_keyed_db, "q"), "Users", ["1", "3"])
+
+    assert names == {"1": "Ava Lee"}
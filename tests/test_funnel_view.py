@@ -0,0 +1,112 @@
+import pytest
+
+from funnel_analysis_agent.funnel_view import (
+    IncrementalFunnel,
+    funnel_count_until_sql,
+    funnel_delta_sql,
+)
+from funnel_analysis_agent.router import parse_counts
+
+
+def full_funnel_count(db, until):
+    rows = db.run(funnel_count_until_sql(until), fetch="cursor").fetchall()
+    return parse_counts(rows[0][0])
+
+
+def test_merge_counts_users_by_consecutive_steps_reached():
+    funnel = IncrementalFunnel(db=None)
+    masks, counts = {}, [0, 0, 0, 0]
+
+    funnel._merge(
+        [("u1", "view", 1), ("u1", "save", 2), ("u2", "view", 3)], masks, counts
+    )
+    # u1 skipped click, so its save doesn't count yet.
+    assert counts == [2, 0, 0, 0]
+
+    funnel._merge([("u1", "click", 4)], masks, counts)
+    assert counts == [2, 1, 1, 0]
+
+
+def test_merge_is_idempotent():
+    funnel = IncrementalFunnel(db=None)
+    masks, counts = {}, [0, 0, 0, 0]
+    rows = [("u1", "view", 1), ("u1", "click", 2), ("u2", "view", 2)]
+
+    funnel._merge(rows, masks, counts)
+    funnel._merge(rows, masks, counts)
+
+    assert counts == [2, 1, 0, 0]
+
+
+def test_merge_returns_the_latest_event_timestamp():
+    funnel = IncrementalFunnel(db=None)
+
+    watermark = funnel._merge(
+        [("u1", "view", 5), ("u2", "view", None), ("u2", "click", 9)],
+        {},
+        [0] * 4,
+    )
+
+    assert watermark == 9
+    assert funnel._merge([], {}, [0] * 4) is None
+
+
+def test_delta_query_raises_the_groups_limit():
+    assert funnel_delta_sql(max_groups=500).endswith(
+        "LIMIT 500 OPTION(numGroupsLimit=500)"
+    )
+
+
+def test_rebuild_matches_funnel_count(local_pinot):
+    funnel = IncrementalFunnel(local_pinot.db)
+    funnel.rebuild()
+
+    assert funnel.counts() == full_funnel_count(local_pinot.db, funnel.watermark)
+
+
+def test_reconcile_keeps_a_matching_view(local_pinot):
+    funnel = IncrementalFunnel(local_pinot.db)
+    funnel.rebuild()
+
+    assert funnel.reconcile()
+    assert funnel.stats()["mismatches"] == 0
+
+
+def test_reconcile_rebuilds_a_view_that_is_off(local_pinot):
+    funnel = IncrementalFunnel(local_pinot.db)
+    funnel.rebuild()
+    expected = funnel.counts()
+    funnel._counts = [count + 1 for count in expected]
+
+    assert not funnel.reconcile()
+    assert funnel.counts() == expected
+    assert funnel.stats()["mismatches"] == 1
+
+
+def test_fetch_that_hits_the_groups_limit_fails(local_pinot):
+    funnel = IncrementalFunnel(local_pinot.db, max_groups=10)
+
+    with pytest.raises(RuntimeError, match="groups limit"):
+        funnel.rebuild()
+    # Nothing partial was merged.
+    assert funnel.watermark is None
+    assert funnel.stats()["users"] == 0
+
+
+def test_failed_refresh_leaves_the_view_untouched(local_pinot, monkeypatch):
+    funnel = IncrementalFunnel(local_pinot.db)
+    funnel.rebuild()
+    before = (dict(funnel._masks), funnel.counts(), funnel.watermark)
+    new_user = [("new-user", "view", funnel.watermark)]
+    # The bad row comes after a good one, so the merge fails halfway.
+    monkeypatch.setattr(
+        funnel, "_fetch", lambda since: new_user + [("u", "click", "not a time")]
+    )
+
+    with pytest.raises(ValueError):
+        funnel.refresh()
+    assert (funnel._masks, funnel._counts, funnel.watermark) == before
+
+    monkeypatch.setattr(funnel, "_fetch", lambda since: new_user)
+    funnel.refresh()
+    assert funnel._counts[0] == before[1][0] + 1
@@ -0,0 +1,98 @@
+import pytest
+
+from funnel_analysis_agent.query_checker import check_query
+
+
+@pytest.fixture(scope="module")
+def schema(local_pinot):
+    return local_pinot.db.get_table_columns()
+
+
+def codes(query, schema=None):
+    return [issue.code for issue in check_query(query, schema)]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT user_id, SUM(duration) AS total FROM clickstream_events "
+        "GROUP BY user_id ORDER BY SUM(duration) DESC LIMIT 3",
+        # Calcite takes an identifier right after an expression as its alias.
+        "SELECT user_id, SUM(duration) total FROM clickstream_events GROUP BY user_id",
+        "SELECT user_id uid, COUNT(*) events FROM clickstream_events GROUP BY user_id",
+        "SELECT CASE WHEN duration > 1000 THEN 1 ELSE 0 END long_event "
+        "FROM clickstream_events",
+        "SELECT FUNNEL_COUNT(STEPS(event_type = 'view', event_type = 'click'), "
+        "CORRELATE_BY(user_id)) AS counts FROM clickstream_events",
+        "SELECT user_id, LOOKUP('ws_2opqcdizwoh9.Users', 'Name', 'ID', user_id) AS name "
+        "FROM clickstream_events LIMIT 10",
+        "SELECT COUNT(*) FROM clickstream_events OPTION(timeoutMs=1000);",
+        # Time units and CURRENT_* are keywords, not columns.
+        "SELECT EXTRACT(YEAR FROM event_timestamp) AS y, COUNT(*) FROM clickstream_events "
+        "GROUP BY EXTRACT(YEAR FROM event_timestamp)",
+        "SELECT COUNT(*) FROM clickstream_events "
+        "WHERE event_timestamp >= TIMESTAMPADD(DAY, -7, CURRENT_TIMESTAMP)",
+        "SELECT TIMESTAMPDIFF(HOUR, MIN(event_timestamp), MAX(event_timestamp)) AS hours "
+        "FROM clickstream_events",
+        "SELECT COUNT(*) FROM clickstream_events "
+        "WHERE event_timestamp >= TIMESTAMPADD(MONTH, -1, CURRENT_DATE)",
+    ],
+)
+def test_valid_queries(query, schema):
+    assert check_query(query, schema) == []
+
+
+@pytest.mark.parametrize(
+    "query, code",
+    [
+        ("DELETE FROM clickstream_events", "not_select"),
+        ("WITH t AS (SELECT 1) SELECT * FROM t", "not_select"),
+        ("SELECT 1 FROM a; SELECT 2 FROM b", "multiple_statements"),
+        ("SELECT COUNT(* FROM clickstream_events", "syntax"),
+        ("SELECT * FROM clickstream_events JOIN Users ON user_id = ID", "join"),
+        (
+            "SELECT user_id FROM clickstream_events WHERE user_id IN "
+            "(SELECT ID FROM Users)",
+            "subquery",
+        ),
+        ("SELECT 1", "no_from_clause"),
+        (
+            "SELECT user_id, LOOKUP('Users', 'Name', 'ID', user_id) FROM clickstream_events",
+            "lookup_database_prefix",
+        ),
+        (
+            "SELECT user_id, LOOKUP('ws_2opqcdizwoh9.Users', 'Name', 'ID', user_id), "
+            "SUM(duration) FROM clickstream_events GROUP BY user_id",
+            "lookup_with_group_by",
+        ),
+        (
+            "SELECT user_id, SUM(duration) AS total FROM clickstream_events "
+            "GROUP BY user_id ORDER BY total DESC",
+            "alias_in_clause",
+        ),
+        (
+            "SELECT user_id, SUM(duration) total FROM clickstream_events "
+            "GROUP BY user_id ORDER BY total DESC",
+            "alias_in_clause",
+        ),
+        ("SELECT user_id FROM clickstream_event", "unknown_table"),
+        ("SELECT user_id, SUM(durration) FROM clickstream_events", "unknown_column"),
+        (
+            "SELECT LOOKUP('ws_2opqcdizwoh9.Users', 'FullName', 'ID', user_id) "
+            "FROM clickstream_events",
+            "unknown_column",
+        ),
+    ],
+)
+def test_invalid_queries(query, code, schema):
+    assert code in codes(query, schema)
+
+
+def test_unknown_column_hint_suggests_close_match(schema):
+    (issue,) = check_query("SELECT SUM(durration) FROM clickstream_events", schema)
+    assert issue.code == "unknown_column" and "duration" in issue.hint
+
+
+def test_rules_are_checked_without_a_schema():
+    assert codes("SELECT user_id FROM clickstream_event") == []
+    assert codes("SELECT * FROM a JOIN b ON a.x = b.y") == ["join"]
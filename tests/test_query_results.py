@@ -0,0 +1,61 @@
+from funnel_analysis_agent.query_results import ColumnarResult, stream_query
+
+EVENTS_QUERY = "SELECT user_id, event_type, duration FROM clickstream_events"
+
+
+def make_result(rows):
+    result = ColumnarResult("", ["user_id", "duration"])
+    result.append_rows(rows)
+    return result
+
+
+def test_small_result_is_shown_in_full():
+    result = make_result([("u1", 3), ("u2", 5)])
+
+    assert result.preview(max_rows=5) == str([("u1", 3), ("u2", 5)])
+
+
+def test_empty_result_previews_as_empty_string():
+    assert make_result([]).preview() == ""
+
+
+def test_large_result_shows_first_rows_and_statistics():
+    result = make_result([(f"u{i % 3}", i) for i in range(10)])
+
+    preview = result.preview(max_rows=2)
+
+    lines = preview.splitlines()
+    assert lines[0] == "10 rows, showing the first 2."
+    assert lines[1] == "Columns: user_id, duration"
+    assert lines[2] == "First rows: " + str([("u0", 0), ("u1", 1)])
+    assert "- user_id: 3 distinct, most frequent: u0 (4)" in preview
+    assert "- duration: min 0, max 9; 0 nulls" in preview
+
+
+def test_truncated_result_says_so_even_when_small():
+    result = make_result([("u1", 3)])
+    result.truncated = True
+
+    preview = result.preview(max_rows=5)
+
+    assert preview.startswith("1 rows (stopped reading there")
+    assert "aggregate or add a LIMIT" in preview
+
+
+def test_stream_query_reads_all_rows_under_the_limit(local_pinot):
+    total = local_pinot.row_counts["clickstream_events"]
+
+    result = stream_query(local_pinot.db, EVENTS_QUERY, max_rows=total, batch_size=7)
+
+    assert result.row_count == total
+    assert not result.truncated
+    assert result.columns == ["user_id", "event_type", "duration"]
+    assert len(result.column("duration")) == total
+
+
+def test_stream_query_stops_at_max_rows(local_pinot):
+    result = stream_query(local_pinot.db, EVENTS_QUERY, max_rows=25, batch_size=7)
+
+    assert result.row_count == 25
+    assert result.truncated
+    assert all(len(column) == 25 for column in result.data)
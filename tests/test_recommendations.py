@@ -0,0 +1,56 @@
+from funnel_analysis_agent.benchmark.local_db import EMBEDDING_DIMENSIONS
+from funnel_analysis_agent.recommendations import (
+    LocalEmbeddingIndex,
+    ProductRecommender,
+    format_recommendations,
+)
+
+
+def test_recommendations_keyed_by_string_ids(local_pinot):
+    user_ids = local_pinot.top_user_ids(2)
+    recommendations = ProductRecommender(
+        local_pinot.db, local_index=LocalEmbeddingIndex(local_pinot.db)
+    ).recommend(user_ids, k=2)
+
+    assert sorted(recommendations) == sorted(user_ids)
+    for user_id in user_ids:
+        top_product = recommendations[user_id]["top_product"]
+        recommended = recommendations[user_id]["recommendations"]
+        assert len(recommended) == 2
+        assert top_product[0] not in [product[0] for product, _ in recommended]
+
+
+def test_numeric_user_ids_match_string_input(local_pinot, monkeypatch):
+    # Pinot hands back an INT user_id column as ints, the LLM passes strings.
+    user_id = local_pinot.top_user_ids(1)[0]
+    recommender = ProductRecommender(
+        local_pinot.db, local_index=LocalEmbeddingIndex(local_pinot.db)
+    )
+    real_rows = recommender._rows
+    monkeypatch.setattr(
+        recommender,
+        "_rows",
+        lambda query: [
+            (42,) + row[1:] if row and row[0] == user_id else row
+            for row in real_rows(query)
+        ],
+    )
+
+    recommendations = recommender.recommend([user_id, "42"], k=1)
+    assert "42" in recommendations
+    assert "no activity found" not in format_recommendations(["42"], recommendations)
+
+
+def test_local_index_reloads_after_refresh_interval(local_pinot):
+    index = LocalEmbeddingIndex(local_pinot.db, refresh_interval=0.0)
+    loads = []
+    load = index.load
+    index.load = lambda: loads.append(1) or load()
+
+    index.search([[1.0] * EMBEDDING_DIMENSIONS], 1)
+    index.search([[1.0] * EMBEDDING_DIMENSIONS], 1)
+    assert len(loads) == 2
+
+    index.refresh_interval = 3600.0
+    index.search([[1.0] * EMBEDDING_DIMENSIONS], 1)
+    assert len(loads) == 2
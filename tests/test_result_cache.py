@@ -0,0 +1,175 @@
+import time
+
+from funnel_analysis_agent.dimensions import DimensionStore, DimensionTable
+from funnel_analysis_agent.query_results import ColumnarResult
+from funnel_analysis_agent.result_cache import (
+    CachedQuerySQLDatabaseTool,
+    QueryResultCache,
+    pinot_watermark_fn,
+)
+
+EVENTS_QUERY = "SELECT COUNT(*) FROM clickstream_events"
+
+
+def make_cache(watermarks, **kwargs):
+    cache = QueryResultCache(watermark_check_interval=0.0, **kwargs)
+
+    def watermark_fn(table):
+        # Probing Pinot must never block other threads' lookups.
+        assert not cache._lock.locked()
+        return watermarks[table]
+
+    cache.watermark_fn = watermark_fn
+    return cache
+
+
+def test_hit_ignores_whitespace_and_semicolons():
+    cache = make_cache({"clickstream_events": 1})
+    cache.put(EVENTS_QUERY, "result")
+    assert cache.get("SELECT  COUNT(*)\nFROM clickstream_events;") == "result"
+    assert cache.stats()["hits"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = make_cache({}, max_entries=2)
+    cache.put("SELECT 1 FROM Users", 1)
+    cache.put("SELECT 2 FROM Users", 2)
+    cache.get("SELECT 1 FROM Users")
+    cache.put("SELECT 3 FROM Users", 3)
+
+    assert cache.get("SELECT 2 FROM Users") is None
+    assert cache.get("SELECT 1 FROM Users") == 1
+    assert cache.get("SELECT 3 FROM Users") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def result_with_rows(n):
+    result = ColumnarResult("", ["n"])
+    result.append_rows((i,) for i in range(n))
+    return result
+
+
+def test_cache_is_bounded_by_total_rows():
+    cache = make_cache({}, max_rows=100)
+    cache.put("SELECT 1 FROM Users", result_with_rows(60))
+    cache.put("SELECT 2 FROM Users", result_with_rows(30))
+    cache.put("SELECT 3 FROM Users", result_with_rows(30))
+
+    assert cache.get("SELECT 1 FROM Users") is None
+    assert cache.get("SELECT 3 FROM Users") is not None
+    assert cache.stats()["rows"] == 60
+    assert cache.stats()["evictions"] == 1
+
+
+def test_result_bigger_than_the_cache_is_not_stored():
+    cache = make_cache({}, max_rows=100)
+    cache.put("SELECT 1 FROM Users", result_with_rows(10))
+    cache.put("SELECT 2 FROM Users", result_with_rows(101))
+
+    assert cache.get("SELECT 2 FROM Users") is None
+    # Nothing was evicted to make room for it.
+    assert cache.get("SELECT 1 FROM Users") is not None
+
+
+def test_replacing_an_entry_releases_its_rows():
+    cache = make_cache({}, max_rows=100)
+    cache.put("SELECT 1 FROM Users", result_with_rows(60))
+    cache.put("SELECT 1 FROM Users", result_with_rows(60))
+
+    assert cache.stats()["rows"] == 60
+    assert cache.stats()["evictions"] == 0
+
+
+def test_entry_expires_after_the_tables_max_age():
+    cache = make_cache(
+        {"clickstream_events": 1}, max_age_seconds={"clickstream_events": 0.05}
+    )
+    cache.put(EVENTS_QUERY, "result")
+    cache.put("SELECT Name FROM Users", "names")
+    time.sleep(0.06)
+
+    assert cache.get(EVENTS_QUERY) is None
+    assert cache.get("SELECT Name FROM Users") == "names"
+    assert cache.stats()["stale"] == 1
+
+
+def test_moved_watermark_makes_entry_stale():
+    watermarks = {"clickstream_events": 1}
+    cache = make_cache(watermarks)
+    cache.put(EVENTS_QUERY, "result")
+    watermarks["clickstream_events"] = 2
+
+    assert cache.get(EVENTS_QUERY) is None
+    assert cache.stats()["stale"] == 1
+
+
+def test_watermark_taken_before_the_query_ran():
+    watermarks = {"clickstream_events": 1}
+    cache = make_cache(watermarks)
+    before = cache.watermarks(EVENTS_QUERY)
+    # New rows land while the query runs, the result may or may not include them.
+    watermarks["clickstream_events"] = 2
+    cache.put(EVENTS_QUERY, "result", before)
+
+    assert cache.get(EVENTS_QUERY) is None
+
+
+def test_tool_serves_repeated_queries_from_the_cache(local_pinot):
+    cache = QueryResultCache(watermark_fn=pinot_watermark_fn(local_pinot.db))
+    tool = CachedQuerySQLDatabaseTool(db=local_pinot.db, cache=cache)
+
+    first, first_id = tool._run(EVENTS_QUERY)
+    second, second_id = tool._run(EVENTS_QUERY + ";")
+
+    assert first == second == str([(local_pinot.row_counts["clickstream_events"],)])
+    assert tool.results.get(first_id) is tool.results.get(second_id)
+    assert cache.stats()["hits"] == 1
+
+
+def test_truncated_results_are_not_cached(local_pinot):
+    cache = QueryResultCache()
+    tool = CachedQuerySQLDatabaseTool(db=local_pinot.db, cache=cache, max_rows=10)
+
+    content, result_id = tool._run("SELECT user_id FROM clickstream_events")
+
+    assert tool.results.get(result_id).truncated
+    assert "stopped reading there" in content
+    assert cache.stats()["entries"] == 0
+
+
+def test_results_are_decorated_with_dimension_columns(local_pinot):
+    tool = CachedQuerySQLDatabaseTool(
+        db=local_pinot.db,
+        cache=QueryResultCache(),
+        dimensions=DimensionStore(local_pinot.db),
+    )
+    user_id = local_pinot.top_user_ids(1)[0]
+    _, result_id = tool._run(
+        f"SELECT user_id, product_id FROM clickstream_events WHERE user_id = '{user_id}'"
+    )
+
+    result = tool.results.get(result_id)
+    assert result.decorated_columns == [
+        "user_name",
+        "product_name",
+        "product_description",
+    ]
+    assert set(result.column("user_name")) == {local_pinot.users[user_id]}
+
+
+def test_query_succeeds_when_dimensions_cannot_be_loaded(local_pinot, caplog):
+    missing = DimensionTable("MissingUsers", "ID", ("Name",), "user_id", "user_")
+    cache = QueryResultCache()
+    tool = CachedQuerySQLDatabaseTool(
+        db=local_pinot.db,
+        cache=cache,
+        dimensions=DimensionStore(local_pinot.db, tables=[missing]),
+    )
+
+    content, result_id = tool._run("SELECT user_id FROM clickstream_events LIMIT 1")
+
+    assert not content.startswith("Error")
+    assert tool.results.get(result_id).decorated_columns == []
+    assert "Could not decorate" in caplog.text
+    # Not cached, so the next run gets another chance at decorating it.
+    assert cache.stats()["entries"] == 0
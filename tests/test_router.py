@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+from funnel_analysis_agent.router import FastPathRouter, match_question
+
+DAY_MILLIS = 24 * 60 * 60 * 1000
+
+
+@pytest.mark.parametrize(
+    "question, intent, params",
+    [
+        ("What is the overall funnel conversion rate?", "conversion_rate", {}),
+        ("what's the conversion rate", "conversion_rate", {}),
+        ("What is the biggest drop-off in the funnel?", "drop_off", {}),
+        ("Where is the largest dropoff?", "drop_off", {}),
+        (
+            "Who are the top 3 users in terms of time spent?",
+            "top_users_by_time",
+            {"n": 3},
+        ),
+        ("Top five users by duration", "top_users_by_time", {"n": 5}),
+        (
+            "What are the top 5 items sold?",
+            "top_items_sold",
+            {"n": 5, "category": None},
+        ),
+        (
+            "What are the top 5 electronic items sold?",
+            "top_items_sold",
+            {"n": 5, "category": "electronic"},
+        ),
+        (
+            "top 2 home & kitchen products purchased",
+            "top_items_sold",
+            {"n": 2, "category": "home & kitchen"},
+        ),
+        (
+            "What are the top 3 best selling items sold?",
+            "top_items_sold",
+            {"n": 3, "category": None},
+        ),
+    ],
+)
+def test_canonical_questions(question, intent, params):
+    route = match_question(question)
+    assert route is not None and route.intent == intent
+    assert {k: route.params[k] for k in params} == params
+    assert route.params.get("since") is None
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # Qualifiers the pre-built queries can't express are left to the agent.
+        "What is the conversion rate from view to click?",
+        "What is the conversion rate for electronics products?",
+        "What is the conversion rate for these top users?",
+        "What was the conversion rate yesterday?",
+        "What is the biggest drop-off for user Brett Castillo?",
+        "Who are the top 3 users in terms of time spent on electronics?",
+        "Who are the top 3 users in terms of time spent yesterday?",
+        "What are the top 5 electronics products purchased last month?",
+        "What are the top 5 items sold in the last 7 days?",
+        "What other products can we recommend to these top users?",
+        "Show me all the click events.",
+    ],
+)
+def test_unparsed_qualifiers_fall_through(question):
+    assert match_question(question) is None
+
+
+@pytest.mark.parametrize(
+    "question, days",
+    [
+        ("What is the overall conversion rate in the last 7 days?", 7),
+        ("What is the conversion rate over the past week?", 7),
+        ("What is the biggest drop-off in the funnel last month?", 30),
+        ("Who are the top 3 users in terms of time spent in the last two days?", 2),
+    ],
+)
+def test_relative_windows(question, days):
+    since = match_question(question).params["since"]
+    assert abs(time.time() * 1000 - days * DAY_MILLIS - since) < 60_000
+
+
+@pytest.mark.parametrize(
+    "question, max_days",
+    [
+        ("What is the overall funnel conversion rate today?", 1),
+        ("Who are the top 3 users in terms of time spent this week?", 7),
+        ("What is the biggest drop-off this month?", 31),
+    ],
+)
+def test_calendar_windows(question, max_days):
+    since = match_question(question).params["since"]
+    now = time.time() * 1000
+    assert since % 60_000 == 0 and now - max_days * DAY_MILLIS < since <= now
+
+
+def test_fast_path_answers_render_as_tool_calls(local_pinot):
+    router = FastPathRouter(local_pinot.db)
+    events = router.answer("Who are the top 3 users in terms of time spent?")
+
+    messages = events[-1]["messages"]
+    tool_calls = [
+        m.tool_calls[0]["name"] for m in messages if getattr(m, "tool_calls", None)
+    ]
+    assert tool_calls == ["sql_db_query", "sql_db_query"]  # totals, then user names
+    top_user = local_pinot.users[local_pinot.top_user_ids(1)[0]]
+    assert f"1. {top_user} " in messages[-1].content
+
+
+def test_unknown_columns_fall_back_to_the_agent(local_pinot):
+    router = FastPathRouter(local_pinot.db, purchase_quantity_column="qty")
+    assert router.answer("What are the top 5 items sold?") is None
+    assert router.answer("What is the overall funnel conversion rate?") is not None
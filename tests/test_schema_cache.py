@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, event, text
+
+from funnel_analysis_agent.schema_cache import CachedSQLDatabase
+
+
+def test_fresh_snapshot_skips_introspection(local_pinot, tmp_path):
+    engine = local_pinot.db._engine
+    snapshot_path = str(tmp_path / "schema.json")
+    CachedSQLDatabase(engine, snapshot_path=snapshot_path).get_table_info()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        db = CachedSQLDatabase(engine, snapshot_path=snapshot_path)
+        assert db._all_tables == db._usable_tables == set(local_pinot.row_counts)
+        assert "CREATE TABLE" in db.schema_prompt()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # Table names and table info both come from the snapshot, nothing is reflected.
+    assert statements == []
+    assert not db._metadata.tables
+
+
+def test_invalidation_picks_up_schema_changes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE a (x INTEGER)"))
+    db = CachedSQLDatabase(engine)
+    assert db.get_usable_table_names() == ["a"]
+    assert "z INTEGER" not in db.get_table_info()
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE b (y INTEGER)"))
+        connection.execute(text("ALTER TABLE a ADD COLUMN z INTEGER"))
+    # Until then the cached schema is served.
+    assert db.get_usable_table_names() == ["a"]
+    db.invalidate_metadata()
+
+    assert db.get_usable_table_names() == ["a", "b"]
+    assert "z INTEGER" in db.get_table_info()
+    assert "CREATE TABLE b" in db.get_table_info()
+    assert "z INTEGER" in db.schema_prompt()
+    assert db.get_table_columns() == {"a": ["x", "z"], "b": ["y"]}
+
+
+def test_expired_cache_picks_up_new_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE a (x INTEGER)"))
+    db = CachedSQLDatabase(engine, ttl_seconds=0.0)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE b (y INTEGER)"))
+
+    assert db.get_usable_table_names() == ["a", "b"]
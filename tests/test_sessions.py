@@ -0,0 +1,140 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+
+from funnel_analysis_agent.benchmark.scripted_llm import ScriptedChatModel
+from funnel_analysis_agent.main import build_agent
+from funnel_analysis_agent.sessions import (
+    Session,
+    compact_messages,
+    compacting_state_modifier,
+    count_tokens,
+)
+
+
+def turn(n, result_chars=4000):
+    """One question: the checker and query tool calls, their outputs and the answer."""
+    calls = [
+        ("sql_db_query_checker", f"SELECT {n} FROM clickstream_events " * 10),
+        ("sql_db_query", "x" * result_chars),
+    ]
+    messages = [HumanMessage(f"question {n}", id=f"h{n}")]
+    for i, (name, output) in enumerate(calls):
+        call_id = f"call_{n}_{i}"
+        messages.append(
+            AIMessage(
+                "",
+                id=f"a{n}_{i}",
+                tool_calls=[{"name": name, "args": {"query": "q"}, "id": call_id}],
+            )
+        )
+        messages.append(
+            ToolMessage(output, name=name, tool_call_id=call_id, id=f"t{n}_{i}")
+        )
+    messages.append(AIMessage(f"answer {n}", id=f"r{n}"))
+    return messages
+
+
+def history(turns):
+    return [message for n in range(turns) for message in turn(n)]
+
+
+def assert_valid_history(messages):
+    # Every tool call keeps its tool message, and the history starts with a question.
+    call_ids = {c["id"] for m in messages for c in getattr(m, "tool_calls", [])}
+    tool_ids = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    assert call_ids == tool_ids
+    assert isinstance(messages[0], HumanMessage)
+
+
+def test_history_within_budget_is_untouched():
+    messages = history(2)
+    assert compact_messages(messages, token_budget=10_000) == messages
+
+
+def test_transient_outputs_go_first():
+    messages = history(3)
+    budget = count_tokens(messages) - 1
+    compacted = compact_messages(messages, budget)
+
+    assert len(compacted) == len(messages)
+    assert compacted[2].content == "[sql_db_query_checker output removed]"
+    assert compacted[4].content == messages[4].content  # results still whole
+    assert count_tokens(compacted) <= budget
+
+
+def test_results_are_truncated_then_evicted():
+    messages = history(3)
+    current = count_tokens(messages[-6:])
+
+    truncated = compact_messages(messages, token_budget=current + 500)
+    assert truncated[4].content.endswith("[truncated, 4000 characters in total]")
+    assert truncated[-2].content == "x" * 4000
+
+    evicted = compact_messages(messages, token_budget=current + 100)
+    assert len(evicted) == len(messages)
+    assert evicted[4].content == "[sql_db_query output removed]"
+    assert_valid_history(evicted)
+
+
+def test_system_message_function_is_called_every_time():
+    prompts = iter(["schema v1", "schema v2"])
+    modifier = compacting_state_modifier(lambda: next(prompts))
+    state = {"messages": history(1)}
+
+    assert modifier(state)[0].content == "schema v1"
+    assert modifier(state)[0].content == "schema v2"
+
+
+def test_current_question_is_never_touched():
+    messages = history(3)
+    compacted = compact_messages(messages, token_budget=10)
+
+    # Only the whole last question is left, as is.
+    assert compacted == messages[-6:]
+    assert_valid_history(compacted)
+
+
+def test_oldest_questions_are_dropped_whole():
+    messages = history(4)
+    last = turn(4, result_chars=0)
+    compacted = compact_messages(messages + last, token_budget=count_tokens(last) + 20)
+
+    assert [m.content for m in compacted if isinstance(m, HumanMessage)][-1] == (
+        "question 4"
+    )
+    assert "question 0" not in [m.content for m in compacted]
+    assert_valid_history(compacted)
+
+
+@tool
+def sql_db_query(query: str) -> str:
+    """Runs a query."""
+    return "r" * 8000
+
+
+def test_session_compacts_the_stored_history():
+    questions = [f"question {n}" for n in range(4)]
+    llm = ScriptedChatModel(
+        scripts={
+            q: [
+                {"tool": "sql_db_query", "args": {"query": q}},
+                {"answer": f"answer to {q}"},
+            ]
+            for q in questions
+        }
+    )
+    agent = build_agent(llm, [sql_db_query], "system", checkpointer=MemorySaver())
+    session = Session(agent, token_budget=1_500)
+
+    for question in questions:
+        events = list(session.stream(question))
+        assert events[-1]["messages"][-1].content == f"answer to {question}"
+
+    stored = session.messages
+    assert count_tokens(stored) <= 1_500 + count_tokens(stored[-4:])
+    assert stored[-1].content == "answer to question 3"
+    assert_valid_history(stored)
+    # The latest results are kept whole, older ones were compacted or dropped.
+    assert stored[-2].content == "r" * 8000
+    assert all(len(m.content) < 8000 for m in stored[:-4] if isinstance(m, ToolMessage))
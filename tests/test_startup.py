@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Generous bound, a cold import that pulls in langchain/openai/pinotdb takes several seconds.
+MAX_IMPORT_SECONDS = 1.0
+
+IMPORT_SCRIPT = """
+import socket
+import sys
+import time
+
+def no_network(*args, **kwargs):
+    raise RuntimeError("network access during import")
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+
+start = time.perf_counter()
+import funnel_analysis_agent.main
+elapsed = time.perf_counter() - start
+
+heavy = [m for m in ("langchain", "langchain_openai", "langgraph", "pinotdb", "sqlalchemy") if m in sys.modules]
+print(elapsed)
+print(",".join(heavy))
+"""
+
+
+def test_cold_import_is_fast_offline_and_lazy():
+    # No credentials and no network, importing must still succeed.
+    env = {
+        k: v
+        for k, v in os.environ.items()
+        if k not in ("PINOT_SQLALCHEMY_URI", "OPENAI_API_KEY")
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, heavy = result.stdout.strip().splitlines() + [""] * (
+        2 - len(result.stdout.strip().splitlines())
+    )
+
+    assert float(elapsed) < MAX_IMPORT_SECONDS
+    assert heavy == "", f"heavy modules imported eagerly: {heavy}"
+
+
+def test_bundled_system_prompt_is_versioned():
+    from funnel_analysis_agent.main import load_system_prompt_template
+
+    template = load_system_prompt_template(source="bundled")
+    assert "{dialect}" in template and "{top_k}" in template
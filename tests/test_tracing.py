@@ -0,0 +1,185 @@
+import json
+from uuid import uuid4
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import Generation, LLMResult
+from langchain_core.tools import tool
+
+from funnel_analysis_agent.benchmark.scripted_llm import ScriptedChatModel
+from funnel_analysis_agent.main import build_agent
+from funnel_analysis_agent.tracing import RunTracer, TraceSink, _quantile
+
+QUESTION = "How many events are there?"
+
+
+@tool
+def count_events(query: str) -> str:
+    """Counts events."""
+    return "12345"
+
+
+def run_agent(tracer):
+    llm = ScriptedChatModel(
+        scripts={
+            QUESTION: [
+                {"tool": "count_events", "args": {"query": "all"}},
+                {"answer": "There are 12345 events."},
+            ]
+        }
+    )
+    agent = build_agent(llm, [count_events], "system")
+    return agent.invoke(
+        {"messages": [("user", QUESTION)]}, config={"callbacks": [tracer]}
+    )
+
+
+def summary(status="ok", total_ms=1000.0, stage_ms=None, tokens=(10, 5), calls=(2, 1)):
+    return {
+        "status": status,
+        "total_ms": total_ms,
+        "stage_ms": stage_ms or {},
+        "input_tokens": tokens[0],
+        "output_tokens": tokens[1],
+        "llm_calls": calls[0],
+        "tool_calls": calls[1],
+    }
+
+
+def test_agent_run_records_llm_and_tool_spans():
+    tracer = RunTracer(QUESTION)
+    result = run_agent(tracer)
+
+    assert [(span.kind, span.name) for span in tracer.spans] == [
+        ("llm", "ScriptedChatModel"),
+        ("tool", "count_events"),
+        ("llm", "ScriptedChatModel"),
+    ]
+    assert not tracer._open
+    assert tracer.spans[1].result_size == len("12345")
+    assert tracer.spans[2].result_size == len("There are 12345 events.")
+
+    usage = [m.usage_metadata for m in result["messages"] if isinstance(m, AIMessage)]
+    assert [span.input_tokens for span in tracer.spans if span.kind == "llm"] == [
+        u["input_tokens"] for u in usage
+    ]
+    assert [span.output_tokens for span in tracer.spans if span.kind == "llm"] == [
+        u["output_tokens"] for u in usage
+    ]
+
+
+def test_summary_totals():
+    tracer = RunTracer(QUESTION)
+    run_agent(tracer)
+
+    totals = tracer.summary()
+
+    assert totals["question"] == QUESTION
+    assert totals["status"] == "ok"
+    assert (totals["llm_calls"], totals["tool_calls"]) == (2, 1)
+    assert totals["input_tokens"] == sum(span.input_tokens for span in tracer.spans)
+    assert totals["output_tokens"] == sum(span.output_tokens for span in tracer.spans)
+    assert totals["stage_ms"] == {
+        "llm": pytest.approx(
+            sum(span.duration_ms for span in tracer.spans if span.kind == "llm")
+        ),
+        "count_events": pytest.approx(tracer.spans[1].duration_ms),
+    }
+    assert totals["total_ms"] >= sum(totals["stage_ms"].values())
+    assert len(totals["spans"]) == 3
+    # The run is timed once, later summaries report the same total.
+    assert tracer.summary("timeout")["total_ms"] == totals["total_ms"]
+
+
+def test_token_usage_falls_back_to_llm_output():
+    tracer = RunTracer(QUESTION)
+    run_id = uuid4()
+    tracer.on_llm_start({"name": "completion"}, ["prompt"], run_id=run_id)
+    tracer.on_llm_end(
+        LLMResult(
+            generations=[[Generation(text="answer")]],
+            llm_output={"token_usage": {"prompt_tokens": 7, "completion_tokens": 3}},
+        ),
+        run_id=run_id,
+    )
+
+    (span,) = tracer.spans
+    assert (span.kind, span.name) == ("llm", "completion")
+    assert (span.input_tokens, span.output_tokens) == (7, 3)
+    assert span.result_size == len("answer")
+
+
+def test_errors_close_their_spans():
+    tracer = RunTracer(QUESTION)
+    run_id = uuid4()
+    tracer.on_tool_start({"name": "sql_db_query"}, "SELECT 1", run_id=run_id)
+    tracer.on_tool_error(ValueError("bad query"), run_id=run_id)
+    with pytest.raises(RuntimeError):
+        with tracer.span("fast_path", "router"):
+            raise RuntimeError("no route")
+
+    assert [(span.name, span.error) for span in tracer.spans] == [
+        ("sql_db_query", "bad query"),
+        ("router", "no route"),
+    ]
+    assert not tracer._open
+
+
+@pytest.mark.parametrize(
+    "q, expected",
+    [(0.5, 5), (0.9, 9), (0.99, 10), (0.0, 1), (1.0, 10)],
+)
+def test_quantile_nearest_rank(q, expected):
+    assert _quantile(list(range(10, 0, -1)), q) == expected
+
+
+def test_quantile_of_nothing_is_zero():
+    assert _quantile([], 0.5) == 0.0
+    assert _quantile([3.0], 0.99) == 3.0
+
+
+def test_trace_sink_appends_json_lines(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    sink = TraceSink(str(path))
+    sink.record(summary())
+    sink.record(summary(status="timeout"))
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["status"] for line in lines] == ["ok", "timeout"]
+
+
+def test_prometheus_text():
+    sink = TraceSink()
+    sink.record(
+        summary(total_ms=1000.0, stage_ms={"llm": 600.0, "sql_db_query": 300.0})
+    )
+    sink.record(summary(status="error: boom", total_ms=3000.0, stage_ms={"llm": 900.0}))
+    sink.record(summary(status="error: other: detail", total_ms=2000.0, tokens=(1, 1)))
+
+    lines = sink.prometheus_text().splitlines()
+
+    for expected in [
+        'funnel_agent_question_duration_seconds{quantile="0.5"} 2.000000',
+        'funnel_agent_question_duration_seconds{quantile="0.9"} 3.000000',
+        'funnel_agent_question_duration_seconds{quantile="0.99"} 3.000000',
+        "funnel_agent_question_duration_seconds_sum 6.000000",
+        "funnel_agent_question_duration_seconds_count 3",
+        'funnel_agent_stage_seconds_total{stage="llm"} 1.500000',
+        'funnel_agent_stage_seconds_total{stage="sql_db_query"} 0.300000',
+        'funnel_agent_tokens_total{type="input"} 21',
+        'funnel_agent_tokens_total{type="output"} 11',
+        'funnel_agent_calls_total{kind="llm"} 6',
+        'funnel_agent_calls_total{kind="tool"} 3',
+        'funnel_agent_questions_total{status="error"} 2',
+        'funnel_agent_questions_total{status="ok"} 1',
+    ]:
+        assert expected in lines
+    assert not [line for line in lines if "boom" in line or "other" in line]
+
+
+def test_prometheus_text_without_runs():
+    text = TraceSink().prometheus_text()
+
+    assert 'funnel_agent_question_duration_seconds{quantile="0.5"} 0.000000' in text
+    assert "funnel_agent_question_duration_seconds_count 0" in text
+    assert text.endswith("\n")